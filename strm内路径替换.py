@@ -1,62 +1,801 @@
 import os
 import re
+import time
+import queue
+import zlib
+import hashlib
 import shutil
+import sqlite3
+import tempfile
+import threading
+import urllib.parse
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
-import chardet
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from 编码检测 import detect_encoding_from_bytes
 
-# 检测文件编码，避免编码错误
-def detect_encoding(file_path):
-    with open(file_path, 'rb') as f:
-        raw = f.read(1000)
-    result = chardet.detect(raw)
-    return result['encoding'] or 'utf-8'
+try:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+except NameError:
+    script_dir = os.getcwd()
+
+# 每次替换的备份日志放在脚本目录下，不放进媒体库，避免被 Emby 当成媒体扫描
+BACKUP_DIR = os.path.join(script_dir, "strm_replace_backups")
+# STRM 内容缓存：路径 -> (大小, 修改时间, 编码, 内容)，大小和修改时间没变就不再读文件
+CACHE_FILE = os.path.join(script_dir, "strm_content_cache.db")
+# STRM 链接索引：按主机、路径前缀、路径片段快速查询
+URL_INDEX_FILE = os.path.join(script_dir, "strm_url_index.db")
+
+# 网络盘上主要耗时在 I/O 等待，线程数可以远多于 CPU 核数
+SCAN_WORKERS = min(64, (os.cpu_count() or 4) * 8)
+
+# 应用修改时的并发写入数，SMB 上太多反而容易断连
+WRITE_WORKERS = min(16, (os.cpu_count() or 4) * 2)
+
+# 预览每页显示的文件数、抽样数
+PAGE_SIZE = 200
+SAMPLE_SIZE = 50
+
+# 界面轮询工作线程结果的间隔（毫秒）
+UI_POLL_MS = 100
+
+# 索引查询方式
+QUERY_MODES = {"主机": "host", "路径前缀": "prefix", "路径片段": "segment", "包含文本": "contains"}
+
+# SQLite 的 TEXT 只能存合法 UTF-8；文件名里有解不开的字节（os 用 surrogateescape 解出的代理字符）时改存原始字节
+def _db_path(path):
+    try:
+        path.encode('utf-8')
+        return path
+    except UnicodeEncodeError:
+        return os.fsencode(path)
+
+def _fs_path(value):
+    return os.fsdecode(value) if isinstance(value, bytes) else value
 
 # 自动对正则表达式中的特殊字符进行转义
 def escape_regex_special_chars(s):
     return re.escape(s)
 
+# 多条替换规则：普通文本规则合并成一个正则分支，一次扫描全部替换；
+# 正则规则（支持捕获组）在其后按顺序执行
+class ReplaceRuleSet:
+    def __init__(self, rules):
+        # rules: [(匹配文本, 替换为, 是否正则), ...]
+        self.rules = [r for r in rules if r[0]]
+        literals = {}
+        for old, new, is_regex in self.rules:
+            if not is_regex:
+                literals.setdefault(old, new)
+        self.literal_map = literals
+        self.literal_pattern = None
+        if literals:
+            # 长的优先，避免短规则抢先匹配长规则的前缀
+            alternation = '|'.join(escape_regex_special_chars(k) for k in sorted(literals, key=len, reverse=True))
+            self.literal_pattern = re.compile(alternation)
+        self.regex_rules = [(re.compile(old), new) for old, new, is_regex in self.rules if is_regex]
+
+    def __len__(self):
+        return len(self.rules)
+
+    # 规则文本：每行一条 “旧文本 => 新文本”，以 re: 开头的是正则规则，# 开头为注释
+    @classmethod
+    def from_text(cls, text):
+        rules = []
+        for lineno, line in enumerate(text.splitlines(), 1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            if '=>' not in line:
+                raise ValueError(f"第 {lineno} 行缺少 “=>”：{line}")
+            old, new = line.split('=>', 1)
+            old, new = old.strip(), new.strip()
+            is_regex = old.startswith('re:')
+            if is_regex:
+                old = old[3:].strip()
+                # 替换模板里的分组引用在这里就检查，免得扫描到第一个匹配的文件才报错
+                try:
+                    re.compile(old).sub(new, '')
+                except (re.error, IndexError) as e:
+                    raise ValueError(f"第 {lineno} 行正则规则无效：{e}") from None
+            rules.append((old, new, is_regex))
+        return cls(rules)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            return cls.from_text(f.read())
+
+    def subn(self, content):
+        total = 0
+        if self.literal_pattern is not None:
+            content, count = self.literal_pattern.subn(lambda m: self.literal_map[m.group(0)], content)
+            total += count
+        for pattern, new in self.regex_rules:
+            content, count = pattern.subn(new, content)
+            total += count
+        return content, total
+
+    # 内容里是否有任意一条规则能匹配上，用于从索引中筛选候选文件
+    def search(self, content):
+        if self.literal_pattern is not None and self.literal_pattern.search(content):
+            return True
+        return any(pattern.search(content) for pattern, _ in self.regex_rules)
+
+# 持久化的 STRM 内容缓存，多个扫描线程各用一个只读连接，写入攒批后加锁提交
+# 扫描线程结束后连接不会自己释放，统一记在 _readers 里由 close() 关掉；
+# 完整扫描时记下见过的路径，扫完用 prune() 清掉目录下已删除或移走的文件
+class StrmContentCache:
+    BATCH = 1000
+
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._readers = []
+        self._seen = set()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, encoding TEXT, raw BLOB)"
+        )
+        self.conn.commit()
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.conn = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+
+    # 命中返回 (原始字节, 编码)，否则返回 None；存不进 TEXT 的路径不缓存
+    def lookup(self, path, size, mtime_ns):
+        if not isinstance(_db_path(path), str):
+            return None
+        self._seen.add(path)
+        row = self._reader().execute(
+            "SELECT raw, encoding FROM cache WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, size, mtime_ns),
+        ).fetchone()
+        return row
+
+    def put(self, path, size, mtime_ns, encoding, raw):
+        if not isinstance(_db_path(path), str):
+            return
+        with self._lock:
+            self._pending.append((path, size, mtime_ns, encoding, raw))
+            if len(self._pending) >= self.BATCH:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._pending:
+            self.conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", self._pending)
+            self.conn.commit()
+            self._pending = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    # 对 folder 做完一次完整扫描（没有文件名过滤）后调用，删掉这个目录下本次没见到的缓存行
+    def prune(self, folder):
+        self.flush()
+        low = os.path.join(folder, '')
+        rows = self.conn.execute(
+            "SELECT path FROM cache WHERE path >= ? AND path < ?", (low, low + '\U0010ffff')
+        ).fetchall()
+        stale = [row for row in rows if row[0] not in self._seen]
+        self.conn.executemany("DELETE FROM cache WHERE path = ?", stale)
+        self.conn.commit()
+        return len(stale)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            conn.close()
+        self.conn.close()
+
+# 列出单个目录：返回 (子目录列表, 符合条件的 .strm 文件列表 [(路径, 大小, 修改时间)])
+def _scan_dir(path, name_filter):
+    subdirs, files = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                # 只处理 .strm 文件，且文件名中包含指定关键词（如果有）
+                elif entry.name.lower().endswith(".strm") and (not name_filter or name_filter in entry.name):
+                    st = entry.stat()
+                    files.append((entry.path, st.st_size, st.st_mtime_ns))
+    except OSError:
+        pass
+    return subdirs, files
+
+# 读取单个文件的原始字节和编码，只读一次、只判断一次编码；缓存命中时连文件都不读
+def _load_strm(item, cache=None):
+    full_path, size, mtime_ns = item
+    cached = cache.lookup(full_path, size, mtime_ns) if cache is not None else None
+    if cached is not None:
+        return cached
+    with open(full_path, 'rb') as f:
+        raw = f.read()
+    # 内容缓存里已经带着编码，这里不用再走按路径的编码缓存
+    encoding = detect_encoding_from_bytes(raw)
+    if cache is not None:
+        cache.put(full_path, size, mtime_ns, encoding, raw)
+    return raw, encoding
+
+# 读取单个文件并替换
+def _replace_in_file(item, rules, cache=None):
+    full_path = item[0]
+    raw, encoding = _load_strm(item, cache)
+    content = raw.decode(encoding)
+    new_content, count = rules.subn(content)
+    if count > 0:
+        # (原内容, 新内容, 编码, 原始字节)，应用修改时直接复用
+        return full_path, (content.strip(), new_content.strip(), encoding, raw)
+    return None
+
+# 预览结果存到临时 SQLite 文件里，几十万个文件也不占内存；界面分页读取，应用修改时逐批读出
+class PreviewStore:
+    BATCH = 1000
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="strm_preview_", suffix=".db")
+            os.close(fd)
+        self.path = path
+        # 预览在工作线程里生成，做完交给界面线程分页读取，同一时间只有一个线程在用
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS changes ("
+            "path TEXT PRIMARY KEY, old TEXT, new TEXT, encoding TEXT, raw BLOB)"
+        )
+        self._pending = []
+
+    def add(self, path, change):
+        old, new, encoding, raw = change
+        self._pending.append((_db_path(path), old, new, encoding, raw))
+        if len(self._pending) >= self.BATCH:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.conn.executemany("INSERT OR REPLACE INTO changes VALUES (?, ?, ?, ?, ?)", self._pending)
+            self.conn.commit()
+            self._pending = []
+
+    def count(self):
+        self.flush()
+        return self.conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    # 分页读取 (路径, 原内容, 新内容)
+    def page(self, offset, limit):
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT path, old, new FROM changes ORDER BY path LIMIT ? OFFSET ?", (limit, offset)
+        ).fetchall()
+        return [(_fs_path(path), old, new) for path, old, new in rows]
+
+    # 随机抽样 (路径, 原内容, 新内容)
+    def sample(self, n):
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT path, old, new FROM changes ORDER BY RANDOM() LIMIT ?", (n,)
+        ).fetchall()
+        return [(_fs_path(path), old, new) for path, old, new in rows]
+
+    def paths(self):
+        self.flush()
+        for (path,) in self.conn.execute("SELECT path FROM changes ORDER BY path"):
+            yield _fs_path(path)
+
+    # 按批流式读出 (路径, (原内容, 新内容, 编码, 原始字节))，与旧版 preview_map 的条目格式一致
+    def items(self):
+        self.flush()
+        cur = self.conn.execute("SELECT path, old, new, encoding, raw FROM changes ORDER BY path")
+        while True:
+            rows = cur.fetchmany(self.BATCH)
+            if not rows:
+                break
+            for path, old, new, encoding, raw in rows:
+                yield _fs_path(path), (old, new, encoding, raw)
+
+    def close(self):
+        try:
+            self.conn.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+# 用线程池并行遍历目录并处理文件，目录列举和文件读取都在池里进行
+# 传入 on_result 时每个结果直接交给它处理，不在内存里累积；传入 skipped 列表时读不了的文件记进去
+def parallel_scan(folder, name_filter, file_task, workers=SCAN_WORKERS, on_result=None, skipped=None):
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_scan_dir, folder, name_filter): None}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                item = pending.pop(fut)
+                if item is None:
+                    subdirs, files = fut.result()
+                    for d in subdirs:
+                        pending[executor.submit(_scan_dir, d, name_filter)] = None
+                    for item in files:
+                        pending[executor.submit(file_task, item)] = item
+                else:
+                    _collect_result(fut, results, on_result, item, skipped)
+    return results
+
+# 单个文件任务出错（文件被删、编码异常等）时跳过该文件，记下 (路径, 错误) 以便汇总报告
+def _collect_result(fut, results, on_result, item=None, skipped=None):
+    try:
+        res = fut.result()
+    except (OSError, UnicodeDecodeError, LookupError) as e:
+        if skipped is not None:
+            skipped.append((item[0] if isinstance(item, tuple) else item, str(e)))
+        return
+    if res is None:
+        return
+    if on_result is not None:
+        on_result(res)
+    else:
+        results.append(res)
+
+# 对已知的文件列表并行执行 file_task，分批提交避免一次性创建几十万个 future
+def parallel_process(items, file_task, workers=SCAN_WORKERS, on_result=None, skipped=None):
+    results = []
+    items = list(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(items), PreviewStore.BATCH):
+            batch = items[start:start + PreviewStore.BATCH]
+            futures = [executor.submit(file_task, item) for item in batch]
+            for item, fut in zip(batch, futures):
+                _collect_result(fut, results, on_result, item, skipped)
+    return results
+
+def _stat_item(path):
+    st = os.stat(path)
+    return path, st.st_size, st.st_mtime_ns
+
+# 读取 STRM 内容（走缓存），返回 (路径, 大小, 修改时间, 内容)
+def _read_strm_item(item, cache=None):
+    raw, encoding = _load_strm(item, cache)
+    return item + (raw.decode(encoding),)
+
+# 拆分 STRM 链接：返回 (主机名, 端口, 解码后的路径)；主机名不带端口，本地路径没有主机部分，端口为 None
+def split_strm_url(content):
+    url = content.strip().splitlines()[0].strip() if content.strip() else ''
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme and parts.netloc:
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        return (parts.hostname or '').lower(), port, urllib.parse.unquote(parts.path)
+    return '', None, url.replace('\\', '/')
+
+# STRM 链接倒排索引：files 表按主机、路径建索引，segments 表按路径片段建索引，
+# 主机和路径前缀查询都走 B 树索引，几十万条也是毫秒级
+class StrmUrlIndex:
+    # 表结构版本，旧版把带端口的 netloc 存成主机，升级时清空重建
+    VERSION = 2
+
+    def __init__(self, path=URL_INDEX_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.VERSION:
+            self.conn.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS segments;")
+            self.conn.execute(f"PRAGMA user_version = {self.VERSION}")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, content TEXT,"
+            " host TEXT, port INTEGER, url_path TEXT);"
+            "CREATE INDEX IF NOT EXISTS idx_files_host ON files (host, url_path);"
+            "CREATE INDEX IF NOT EXISTS idx_files_url_path ON files (url_path);"
+            "CREATE TABLE IF NOT EXISTS segments (segment TEXT, path TEXT);"
+            "CREATE INDEX IF NOT EXISTS idx_segments ON segments (segment);"
+            "CREATE INDEX IF NOT EXISTS idx_segments_path ON segments (path);"
+        )
+
+    @staticmethod
+    def _range(prefix):
+        # 前缀查询转成区间查询，能用上索引
+        return prefix, prefix + '\U0010ffff'
+
+    def _root_range(self, folder):
+        return self._range(os.path.join(os.path.abspath(folder), ''))
+
+    # 扫描目录重建这个目录下的索引，读取内容走内容缓存；返回索引的文件数，读不了的文件记进 skipped
+    def build(self, folder, workers=SCAN_WORKERS, use_cache=True, skipped=None):
+        cache = StrmContentCache() if use_cache else None
+        low, high = self._root_range(folder)
+        count = 0
+        try:
+            self.conn.execute("DELETE FROM segments WHERE path >= ? AND path < ?", (low, high))
+            self.conn.execute("DELETE FROM files WHERE path >= ? AND path < ?", (low, high))
+            rows, segs = [], []
+
+            def on_result(res):
+                nonlocal count, rows, segs
+                path, size, mtime_ns, content = res
+                # 索引按路径区间查询，只能存 TEXT，文件名不是有效 UTF-8 的不进索引
+                if not isinstance(_db_path(path), str):
+                    if skipped is not None:
+                        skipped.append((path, "文件名不是有效的 UTF-8，无法建立索引"))
+                    return
+                row, path_segs = self._row(path, size, mtime_ns, content)
+                rows.append(row)
+                segs.extend(path_segs)
+                count += 1
+                if len(rows) >= PreviewStore.BATCH:
+                    self._insert(rows, segs)
+                    rows, segs = [], []
+
+            parallel_scan(os.path.abspath(folder), '', lambda item: _read_strm_item(item, cache),
+                          workers=workers, on_result=on_result, skipped=skipped)
+            self._insert(rows, segs)
+            self.conn.commit()
+            if cache is not None:
+                cache.prune(os.path.abspath(folder))
+        finally:
+            if cache is not None:
+                cache.close()
+        return count
+
+    @staticmethod
+    def _row(path, size, mtime_ns, content):
+        host, port, url_path = split_strm_url(content)
+        # 同一片段在路径里出现多次也只记一条
+        segs = [(seg, path) for seg in dict.fromkeys(url_path.split('/')) if seg]
+        return (path, size, mtime_ns, content.strip(), host, port, url_path), segs
+
+    def _insert(self, rows, segs):
+        self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.conn.executemany("INSERT INTO segments VALUES (?, ?)", segs)
+
+    # 应用或还原写过文件后同步索引，entries 为 [(路径, 写入的字节)]；只更新已在索引里的文件
+    def refresh(self, entries):
+        for path, data in entries:
+            if not isinstance(_db_path(path), str):
+                continue
+            if not self.conn.execute("SELECT 1 FROM files WHERE path = ?", (path,)).fetchone():
+                continue
+            self.conn.execute("DELETE FROM segments WHERE path = ?", (path,))
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                continue
+            content = data.decode(detect_encoding_from_bytes(data), errors='replace')
+            row, segs = self._row(path, st.st_size, st.st_mtime_ns, content)
+            self._insert([row], segs)
+        self.conn.commit()
+
+    def count(self, folder):
+        low, high = self._root_range(folder)
+        return self.conn.execute("SELECT COUNT(*) FROM files WHERE path >= ? AND path < ?", (low, high)).fetchone()[0]
+
+    # 查询，mode: host 主机 / prefix 路径前缀 / segment 路径片段 / contains 包含文本；返回 [(文件路径, 链接)]
+    def query(self, folder, mode, text, limit=None):
+        low, high = self._root_range(folder)
+        if mode == 'host':
+            # 可以只写主机名，也可以写 主机:端口 只查某个端口
+            parts = urllib.parse.urlsplit('//' + text.strip())
+            sql = "SELECT path, content FROM files WHERE host = ? AND path >= ? AND path < ?"
+            args = [(parts.hostname or '').lower(), low, high]
+            try:
+                port = parts.port
+            except ValueError:
+                port = None
+            if port is not None:
+                sql += " AND port = ?"
+                args.append(port)
+        elif mode == 'prefix':
+            p_low, p_high = self._range(text)
+            sql = ("SELECT path, content FROM files WHERE url_path >= ? AND url_path < ?"
+                   " AND path >= ? AND path < ?")
+            args = [p_low, p_high, low, high]
+        elif mode == 'segment':
+            sql = ("SELECT DISTINCT f.path, f.content FROM segments s JOIN files f ON f.path = s.path"
+                   " WHERE s.segment = ? AND s.path >= ? AND s.path < ?")
+            args = [text, low, high]
+        elif mode == 'contains':
+            sql = "SELECT path, content FROM files WHERE instr(content, ?) > 0 AND path >= ? AND path < ?"
+            args = [text, low, high]
+        else:
+            raise ValueError(f"不支持的查询方式: {mode}")
+        sql += " ORDER BY 1"
+        if limit:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return self.conn.execute(sql, args).fetchall()
+
+    # 用规则筛出内容可能被修改的文件路径，替代遍历整个目录
+    def candidates(self, folder, rules, name_filter=''):
+        low, high = self._root_range(folder)
+        cur = self.conn.execute("SELECT path, content FROM files WHERE path >= ? AND path < ?", (low, high))
+        for path, content in cur:
+            if name_filter and name_filter not in os.path.basename(path):
+                continue
+            if rules.search(content):
+                yield path
+
+    def close(self):
+        self.conn.close()
+
 # 在 .strm 文件中替换匹配内容，并预览修改结果
-def regex_replace_in_strm(folder, target_text, replacement, name_filter, log_file):
-    modified_files = []  # 保存被修改的文件路径
-    preview_map = {}     # 保存每个文件的修改前后内容
+# rules 为 ReplaceRuleSet 时一次扫描应用全部规则，否则只用 target_text/replacement 一条普通文本规则
+# use_cache 为真时用持久化缓存跳过大小和修改时间都没变的文件
+# use_index 为真时从链接索引里筛选候选文件，不再遍历目录（索引之后新增的文件不会被找到）
+# 返回 (PreviewStore, 被修改的文件数)
+def regex_replace_in_strm(folder, target_text, replacement, name_filter, log_file, rules=None,
+                          use_cache=True, use_index=False, skipped=None):
+    if rules is None:
+        # 普通文本规则会自动转义，防止正则报错
+        rules = ReplaceRuleSet([(target_text, replacement, False)])
 
-    # 自动转义输入的匹配文本，防止正则报错
-    pattern = re.compile(escape_regex_special_chars(target_text))
+    cache = StrmContentCache() if use_cache else None
+    store = PreviewStore()  # 保存每个文件的修改前后内容
+    try:
+        if use_index:
+            index = StrmUrlIndex()
+            try:
+                paths = list(index.candidates(folder, rules, name_filter))
+            finally:
+                index.close()
+            # 索引里的大小和修改时间可能已过期，重新 stat 后再走缓存
+            parallel_process(paths, lambda path: _replace_in_file(_stat_item(path), rules, cache),
+                             on_result=lambda res: store.add(*res), skipped=skipped)
+        else:
+            parallel_scan(folder, name_filter, lambda item: _replace_in_file(item, rules, cache),
+                          on_result=lambda res: store.add(*res), skipped=skipped)
+            # 有文件名过滤时没见到的文件不代表已删除，只有完整扫描才清理
+            if cache is not None and not name_filter:
+                cache.prune(folder)
 
-    for root, _, files in os.walk(folder):
-        for file in files:
-            # 只处理 .strm 文件，且文件名中包含指定关键词（如果有）
-            if file.lower().endswith(".strm") and (not name_filter or name_filter in file):
-                full_path = os.path.join(root, file)
-                encoding = detect_encoding(full_path)
-                with open(full_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-
-                # 替换匹配的文本
-                new_content, count = pattern.subn(replacement, content)
-                if count > 0:
-                    preview_map[full_path] = (content.strip(), new_content.strip())
-                    modified_files.append(full_path)
-
-    # 记录被修改的文件到日志
-    with open(log_file, 'w', encoding='utf-8') as log:
-        for path in modified_files:
-            log.write(path + '\n')
-    return preview_map, modified_files
-
-# 应用修改并备份原始文件
-def apply_changes(preview_map, root_folder):
-    for full_path, (_, new_content) in preview_map.items():
-        encoding = detect_encoding(full_path)
-        rel_path = os.path.relpath(full_path, root_folder)
-        backup_path = os.path.join(root_folder, "bak", rel_path)
-        os.makedirs(os.path.dirname(backup_path), exist_ok=True)
-        shutil.copy2(full_path, backup_path)  # 备份原文件
-        with open(full_path, 'w', encoding=encoding) as f:
-            f.write(new_content)
-
-# 从备份中恢复所有 .strm 文件
+        # 记录被修改的文件到日志，读不了而跳过的文件附在后面
+        with open(log_file, 'w', encoding='utf-8', errors='surrogateescape') as log:
+            for path in store.paths():
+                log.write(path + '\n')
+            for path, err in skipped or ():
+                log.write(f"跳过（无法读取）: {path}，{err}\n")
+    except BaseException:
+        # 出错时调用方拿不到 store，这里关掉，免得临时数据库连接和文件留着
+        store.close()
+        raise
+    finally:
+        if cache is not None:
+            cache.close()
+    return store, store.count()
+
+# 先写同目录临时文件再 os.replace 替换，中途断电或断连也不会留下写了一半的 STRM
+def atomic_write_bytes(path, data):
+    directory, name = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory or None)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            shutil.copymode(path, tmp)
+        except OSError:
+            pass
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+# 每次替换对应一个备份日志（SQLite 文件）：记录 路径、压缩后的原始字节和新字节、新内容哈希、时间、是否已写入，
+# 整批备份在一个事务里顺序写入；应用中断后可按 done 标记继续，还原时只处理这一批涉及的文件
+# done 为 PENDING 待写入、WRITTEN 已写入、FAILED 写入失败；失败的不算未完成，不会每次启动都提示继续
+class BackupJournal:
+    PENDING, WRITTEN, FAILED = 0, 1, -1
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, old BLOB, new BLOB, new_hash TEXT, ts REAL, done INTEGER DEFAULT 0)"
+        )
+
+    @classmethod
+    def create(cls, root_folder):
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        created = time.time()
+        name = time.strftime("run_%Y%m%d_%H%M%S", time.localtime(created))
+        path = os.path.join(BACKUP_DIR, name + ".db")
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(BACKUP_DIR, f"{name}_{n}.db")
+            n += 1
+        journal = cls(path)
+        journal.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                 [("root", os.path.abspath(root_folder)), ("created", str(created))])
+        journal.conn.commit()
+        return journal
+
+    # 列出某个目录的全部备份，最新的在前：[(日志路径, 创建时间, 文件数, 未完成数)]
+    @staticmethod
+    def list_runs(root_folder):
+        runs = []
+        if not os.path.isdir(BACKUP_DIR):
+            return runs
+        root = os.path.abspath(root_folder)
+        for name in os.listdir(BACKUP_DIR):
+            if not name.endswith(".db"):
+                continue
+            path = os.path.join(BACKUP_DIR, name)
+            try:
+                conn = sqlite3.connect(path)
+                meta = dict(conn.execute("SELECT key, value FROM meta"))
+                count = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+                pending = conn.execute("SELECT COUNT(*) FROM files WHERE done = ?",
+                                       (BackupJournal.PENDING,)).fetchone()[0]
+                conn.close()
+            except sqlite3.Error:
+                continue
+            # 记录备份时就出错的批次里一个文件都没有，没什么可还原或继续的
+            if meta.get("root") == root and count:
+                runs.append((path, float(meta.get("created", 0)), count, pending))
+        runs.sort(key=lambda r: r[1], reverse=True)
+        return runs
+
+    # entries: [(路径, 原始字节, 新字节)]，一次事务写完
+    def record(self, entries):
+        now = time.time()
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, {self.PENDING})",
+            ((_db_path(path), zlib.compress(raw), zlib.compress(new), hashlib.sha1(new).hexdigest(), now)
+             for path, raw, new in entries),
+        )
+        self.conn.commit()
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def pending(self):
+        return self.conn.execute("SELECT COUNT(*) FROM files WHERE done = ?", (self.PENDING,)).fetchone()[0]
+
+    # 并行写入还没完成的文件，每批写完就把 done 标记落盘；中断后再调用会从断点继续
+    # 写失败的标成 FAILED，之后不再自动重试；返回 (写入数, 失败数)
+    def apply(self, workers=WRITE_WORKERS):
+        def write_one(path, new):
+            atomic_write_bytes(_fs_path(path), zlib.decompress(new))
+            return path
+
+        written = failed = 0
+        # 先取出待写路径再分批处理，避免边读边改同一张表
+        paths = [row[0] for row in self.conn.execute("SELECT path FROM files WHERE done = ? ORDER BY path",
+                                                      (self.PENDING,))]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for start in range(0, len(paths), PreviewStore.BATCH):
+                batch = paths[start:start + PreviewStore.BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = self.conn.execute(f"SELECT path, new FROM files WHERE path IN ({marks})", batch).fetchall()
+                futures = [(executor.submit(write_one, path, new), path, new) for path, new in rows]
+                done, errors = [], []
+                for fut, path, new in futures:
+                    try:
+                        done.append((fut.result(), zlib.decompress(new)))
+                        written += 1
+                    except OSError:
+                        errors.append((path,))
+                        failed += 1
+                self.conn.executemany(f"UPDATE files SET done = {self.WRITTEN} WHERE path = ?",
+                                      ((path,) for path, _ in done))
+                self.conn.executemany(f"UPDATE files SET done = {self.FAILED} WHERE path = ?", errors)
+                self.conn.commit()
+                self._refresh_index([(_fs_path(path), data) for path, data in done])
+        return written, failed
+
+    def close(self):
+        self.conn.close()
+
+    # 写过的文件同步到链接索引，没建过索引就不用管
+    @staticmethod
+    def _refresh_index(entries):
+        if not entries or not os.path.exists(URL_INDEX_FILE):
+            return
+        index = StrmUrlIndex()
+        try:
+            index.refresh(entries)
+        finally:
+            index.close()
+
+    # 并行还原本批次的文件：内容已经和备份一致的跳过；当前内容不是这批写入的（之后又被改过、或已删除）
+    # 也不动，免得覆盖后来的修改；返回 (还原数, 跳过数, 冲突路径列表, 失败数)
+    def restore(self, workers=WRITE_WORKERS):
+        def restore_one(path, old, new_hash):
+            path = _fs_path(path)
+            old = zlib.decompress(old)
+            try:
+                with open(path, 'rb') as f:
+                    current = f.read()
+            except FileNotFoundError:
+                return 'conflict'
+            if current == old:
+                return 'skipped'
+            if hashlib.sha1(current).hexdigest() != new_hash:
+                return 'conflict'
+            atomic_write_bytes(path, old)
+            restored.append((path, old))
+            return 'restored'
+
+        stats = {'restored': 0, 'skipped': 0, 'failed': 0}
+        conflicts = []
+        restored = []
+        cur = self.conn.execute("SELECT path, old, new_hash FROM files")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                rows = cur.fetchmany(PreviewStore.BATCH)
+                if not rows:
+                    break
+                futures = [(executor.submit(restore_one, *row), row[0]) for row in rows]
+                for fut, path in futures:
+                    try:
+                        result = fut.result()
+                    except OSError:
+                        stats['failed'] += 1
+                        continue
+                    if result == 'conflict':
+                        conflicts.append(_fs_path(path))
+                    else:
+                        stats[result] += 1
+                self._refresh_index(restored)
+                restored = []
+        return stats['restored'], stats['skipped'], conflicts, stats['failed']
+
+# 应用修改并备份原始文件，preview_map 可以是 PreviewStore 或 {路径: (原内容, 新内容, 编码, 原始字节)}
+# 返回 (备份日志路径, 写入数, 失败数)
+def apply_changes(preview_map, root_folder, workers=WRITE_WORKERS):
+    # 先把整批原始字节写进备份日志，再动文件
+    journal = BackupJournal.create(root_folder)
+    unencodable = 0
+
+    def entries():
+        nonlocal unencodable
+        for full_path, (_, new_content, encoding, raw) in preview_map.items():
+            try:
+                new = new_content.encode(encoding)
+            except UnicodeEncodeError:
+                # 替换后的文本用原文件的编码写不出来，这个文件不动，算作失败
+                unencodable += 1
+                continue
+            yield full_path, raw, new
+
+    try:
+        journal.record(entries())
+        written, failed = journal.apply(workers)
+    finally:
+        journal.close()
+    return journal.path, written, failed + unencodable
+
+# 继续一次被中断的替换，返回 (写入数, 失败数)
+def resume_changes(journal_path, workers=WRITE_WORKERS):
+    journal = BackupJournal(journal_path)
+    try:
+        return journal.apply(workers)
+    finally:
+        journal.close()
+
+# 从旧版 bak/ 目录中恢复所有 .strm 文件
 def restore_from_backup(folder):
     bak_folder = os.path.join(folder, "bak")
     if not os.path.exists(bak_folder):
@@ -83,48 +822,223 @@ def run_gui():
             entry_path.delete(0, tk.END)
             entry_path.insert(0, path)
 
-    # 点击“预览修改”后执行的操作
+    # 点击“预览修改”后执行的操作：界面线程只校验输入，扫描放到工作线程，结果经 ui_queue 交回界面线程
     def start_preview():
         folder = entry_path.get()
         target_text = entry_old.get()
         repl = entry_new.get()
         keyword = entry_keyword.get()
-        if not (folder and target_text):
-            messagebox.showerror("错误", "请输入文件夹路径和目标文本。")
+        rules_text = text_rules.get("1.0", tk.END)
+        if not (folder and (target_text or rules_text.strip())):
+            messagebox.showerror("错误", "请输入文件夹路径和目标文本（或批量规则）。")
             return
 
-        log_file = os.path.join(folder, "strm_regex_replace_log.txt")
-        preview, modified = regex_replace_in_strm(folder, target_text, repl, keyword, log_file)
+        try:
+            rules = ReplaceRuleSet.from_text(rules_text)
+        except (ValueError, re.error) as e:
+            messagebox.showerror("规则错误", str(e))
+            return
+        if target_text:
+            rules = ReplaceRuleSet([(target_text, repl, False)] + rules.rules)
 
+        log_file = os.path.join(folder, "strm_regex_replace_log.txt")
+        global preview_result
+        if preview_result is not None:
+            preview_result.close()
+            preview_result = None
+        use_index = use_index_var.get()
+        button_preview.config(state="disabled")
         text_preview.delete("1.0", tk.END)
-        if not preview:
-            text_preview.insert(tk.END, "没有找到匹配的内容。\n")
-        else:
-            for path, (old, new) in preview.items():
-                text_preview.insert(tk.END, f"文件: {path}\n")
-                text_preview.insert(tk.END, f"原内容: {old}\n")
-                text_preview.insert(tk.END, f"新内容: {new}\n\n")
-        # 保存全局变量用于确认替换
-        global preview_result, preview_root
+        text_preview.insert(tk.END, "正在扫描，请稍候……\n")
+        label_page.config(text="")
+
+        def worker():
+            skipped = []
+            try:
+                preview, _ = regex_replace_in_strm(folder, target_text, repl, keyword, log_file, rules=rules,
+                                                   use_index=use_index, skipped=skipped)
+            except Exception as e:
+                ui_queue.put(("preview_error", str(e)))
+                return
+            ui_queue.put(("preview", (preview, folder, skipped, log_file)))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    # 预览完成：保存全局变量用于确认替换
+    def finish_preview(result):
+        global preview_result, preview_root, preview_page
+        preview, folder, skipped, log_file = result
+        button_preview.config(state="normal")
         preview_result = preview
         preview_root = folder
+        preview_page = 0
+        show_page()
+        if skipped:
+            messagebox.showwarning("部分文件已跳过", f"{len(skipped)} 个文件无法读取或解码，已跳过，详见日志：{log_file}")
+
+    # 在界面线程里处理工作线程发来的结果
+    def poll_queue():
+        try:
+            while True:
+                kind, value = ui_queue.get_nowait()
+                if kind == "preview":
+                    finish_preview(value)
+                elif kind == "preview_error":
+                    button_preview.config(state="normal")
+                    text_preview.delete("1.0", tk.END)
+                    messagebox.showerror("预览失败", value)
+        except queue.Empty:
+            pass
+        window.after(UI_POLL_MS, poll_queue)
+
+    # 预览区只显示当前一页
+    def render_rows(rows, title):
+        text_preview.delete("1.0", tk.END)
+        text_preview.insert(tk.END, title + "\n\n")
+        for path, old, new in rows:
+            text_preview.insert(tk.END, f"文件: {path}\n")
+            text_preview.insert(tk.END, f"原内容: {old}\n")
+            text_preview.insert(tk.END, f"新内容: {new}\n\n")
+
+    def show_page(step=0):
+        global preview_page
+        if preview_result is None:
+            return
+        total = preview_result.count()
+        if not total:
+            text_preview.delete("1.0", tk.END)
+            text_preview.insert(tk.END, "没有找到匹配的内容。\n")
+            label_page.config(text="")
+            return
+        pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+        preview_page = max(0, min(pages - 1, preview_page + step))
+        rows = preview_result.page(preview_page * PAGE_SIZE, PAGE_SIZE)
+        render_rows(rows, f"共 {total} 个文件需要修改")
+        label_page.config(text=f"第 {preview_page + 1}/{pages} 页，共 {total} 个文件")
+
+    def show_sample():
+        if preview_result is None or not preview_result.count():
+            return
+        render_rows(preview_result.sample(SAMPLE_SIZE), f"随机抽样 {SAMPLE_SIZE} 个（共 {preview_result.count()} 个文件）")
+
+    # 从文件载入批量规则
+    def load_rules_file():
+        path = filedialog.askopenfilename(filetypes=[("规则文件", "*.txt"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8-sig') as f:
+                content = f.read()
+            ReplaceRuleSet.from_text(content)
+        except (OSError, ValueError, re.error) as e:
+            messagebox.showerror("规则错误", str(e))
+            return
+        text_rules.delete("1.0", tk.END)
+        text_rules.insert(tk.END, content)
+
+    # 建立 / 重建当前目录的链接索引
+    def build_index():
+        folder = entry_path.get()
+        if not folder:
+            messagebox.showerror("错误", "请先选择目录")
+            return
+        start = time.time()
+        index = StrmUrlIndex()
+        skipped = []
+        try:
+            count = index.build(folder, skipped=skipped)
+        finally:
+            index.close()
+        note = f"\n{len(skipped)} 个文件无法读取，已跳过，例如：{skipped[0][0]}（{skipped[0][1]}）" if skipped else ""
+        messagebox.showinfo("完成", f"已为 {count} 个 STRM 建立索引，耗时 {time.time() - start:.1f} 秒。{note}")
+
+    # 在索引里查询，只显示前一页结果
+    def query_index():
+        folder = entry_path.get()
+        text = entry_query.get().strip()
+        if not (folder and text):
+            messagebox.showerror("错误", "请先选择目录并输入查询内容")
+            return
+        mode = QUERY_MODES[query_mode_var.get()]
+        start = time.time()
+        index = StrmUrlIndex()
+        try:
+            if not index.count(folder):
+                messagebox.showwarning("提示", "当前目录还没有索引，请先建立索引。")
+                return
+            rows = index.query(folder, mode, text)
+        finally:
+            index.close()
+        cost = (time.time() - start) * 1000
+        text_preview.delete("1.0", tk.END)
+        text_preview.insert(tk.END, f"查询到 {len(rows)} 个文件，耗时 {cost:.0f} 毫秒\n\n")
+        for path, content in rows[:PAGE_SIZE]:
+            text_preview.insert(tk.END, f"{path}\n    {content}\n")
+        if len(rows) > PAGE_SIZE:
+            text_preview.insert(tk.END, f"\n……仅显示前 {PAGE_SIZE} 个\n")
+        label_page.config(text="")
 
     # 确认替换按钮点击后执行的操作
     def confirm_replace():
-        if not preview_result:
+        # 上次替换中途断开的，先询问是否从断点继续
+        folder = entry_path.get()
+        unfinished = [r for r in BackupJournal.list_runs(folder) if r[3]] if folder else []
+        if unfinished:
+            path, _, count, pending = unfinished[0]
+            if messagebox.askyesno("继续未完成的替换", f"发现上次未完成的替换（{pending}/{count} 个文件未写入），是否继续？"):
+                written, failed = resume_changes(path)
+                messagebox.showinfo("完成", f"已继续写入 {written} 个文件，失败 {failed} 个。\n备份保存在：{path}")
+                return
+
+        if preview_result is None or not preview_result.count():
             messagebox.showwarning("提示", "请先预览，确认有文件需要替换。")
             return
-        apply_changes(preview_result, preview_root)
-        messagebox.showinfo("完成", f"已完成替换并备份，修改了 {len(preview_result)} 个文件。\n备份保存在：{preview_root}/bak/")
+        journal_path, written, failed = apply_changes(preview_result, preview_root)
+        messagebox.showinfo("完成", f"已完成替换并备份，修改了 {written} 个文件，失败 {failed} 个。\n备份保存在：{journal_path}")
 
-    # 还原备份文件
+    # 还原备份文件：选择某一次替换的备份日志，只还原那一批文件
     def restore_backup():
         folder = entry_path.get()
         if not folder:
             messagebox.showerror("错误", "请先选择目录")
             return
-        count = restore_from_backup(folder)
-        messagebox.showinfo("还原完成", f"已还原 {count} 个文件。")
+        runs = BackupJournal.list_runs(folder)
+        if not runs:
+            # 兼容旧版放在媒体库里的 bak/ 目录
+            count = restore_from_backup(folder)
+            messagebox.showinfo("还原完成", f"已还原 {count} 个文件。")
+            return
+
+        win = tk.Toplevel(window)
+        win.title("选择要还原的备份")
+        listbox = tk.Listbox(win, width=80, height=12)
+        listbox.pack(padx=10, pady=10, fill="both", expand=True)
+        for path, created, count, _ in runs:
+            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+            listbox.insert(tk.END, f"{ts}    {count} 个文件    {os.path.basename(path)}")
+        listbox.select_set(0)
+
+        def do_restore():
+            sel = listbox.curselection()
+            if not sel:
+                return
+            journal = BackupJournal(runs[sel[0]][0])
+            try:
+                restored, skipped, conflicts, failed = journal.restore()
+            finally:
+                journal.close()
+            win.destroy()
+            if conflicts:
+                text_preview.delete(1.0, tk.END)
+                text_preview.insert(tk.END, f"以下 {len(conflicts)} 个文件在这次替换之后又被修改或删除，未还原：\n")
+                for path in conflicts:
+                    text_preview.insert(tk.END, path + "\n")
+            messagebox.showinfo("还原完成", f"已还原 {restored} 个文件，内容未变跳过 {skipped} 个，"
+                                            f"之后被改动未还原 {len(conflicts)} 个，失败 {failed} 个。")
+
+        tk.Button(win, text="还原所选批次", command=do_restore).pack(pady=(0, 10))
+        win.transient(window)
+        win.grab_set()
 
     # 构建图形界面布局
     window = tk.Tk()
@@ -135,7 +1049,7 @@ def run_gui():
     entry_path.grid(row=0, column=1)
     tk.Button(window, text="浏览", command=select_folder).grid(row=0, column=2)
 
-    tk.Label(window, text="匹配文本（自动转义）：").grid(row=1, column=0, sticky="e")
+    tk.Label(window, text="匹配文本（自动转义，可留空）：").grid(row=1, column=0, sticky="e")
     entry_old = tk.Entry(window, width=60)
     entry_old.grid(row=1, column=1, columnspan=2)
 
@@ -147,20 +1061,62 @@ def run_gui():
     entry_keyword = tk.Entry(window, width=60)
     entry_keyword.grid(row=3, column=1, columnspan=2)
 
+    tk.Label(window, text="批量规则（每行 旧 => 新，\nre: 开头为正则）：").grid(row=4, column=0, sticky="ne")
+    text_rules = scrolledtext.ScrolledText(window, width=58, height=5)
+    text_rules.grid(row=4, column=1)
+    tk.Button(window, text="载入规则文件", command=load_rules_file).grid(row=4, column=2, sticky="n")
+
     # 三个主操作按钮
-    tk.Button(window, text="预览修改", command=start_preview, bg="lightblue").grid(row=4, column=1, pady=5)
-    tk.Button(window, text="确认替换", command=confirm_replace, bg="lightgreen").grid(row=4, column=2, pady=5)
-    tk.Button(window, text="还原备份", command=restore_backup, bg="orange").grid(row=4, column=0, pady=5)
+    button_preview = tk.Button(window, text="预览修改", command=start_preview, bg="lightblue")
+    button_preview.grid(row=5, column=1, pady=5)
+    tk.Button(window, text="确认替换", command=confirm_replace, bg="lightgreen").grid(row=5, column=2, pady=5)
+    tk.Button(window, text="还原备份", command=restore_backup, bg="orange").grid(row=5, column=0, pady=5)
 
     # 显示预览结果
     text_preview = scrolledtext.ScrolledText(window, width=100, height=25)
-    text_preview.grid(row=5, column=0, columnspan=3, padx=10, pady=10)
+    text_preview.grid(row=6, column=0, columnspan=3, padx=10, pady=10)
+
+    # 分页与抽样
+    frame_page = tk.Frame(window)
+    frame_page.grid(row=7, column=0, columnspan=3, pady=(0, 10))
+    tk.Button(frame_page, text="上一页", command=lambda: show_page(-1)).pack(side="left", padx=5)
+    label_page = tk.Label(frame_page, text="")
+    label_page.pack(side="left", padx=10)
+    tk.Button(frame_page, text="下一页", command=lambda: show_page(1)).pack(side="left", padx=5)
+    tk.Button(frame_page, text="随机抽样", command=show_sample).pack(side="left", padx=5)
+
+    # 链接索引
+    frame_index = tk.LabelFrame(window, text="链接索引")
+    frame_index.grid(row=8, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="ew")
+    tk.Button(frame_index, text="建立索引", command=build_index).pack(side="left", padx=5, pady=5)
+    use_index_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(frame_index, text="预览时用索引查找候选文件", variable=use_index_var).pack(side="left", padx=5)
+    query_mode_var = tk.StringVar(value="主机")
+    tk.OptionMenu(frame_index, query_mode_var, *QUERY_MODES).pack(side="left", padx=5)
+    entry_query = tk.Entry(frame_index, width=30)
+    entry_query.pack(side="left", padx=5)
+    tk.Button(frame_index, text="查询", command=query_index).pack(side="left", padx=5)
 
     # 初始化全局变量用于替换和还原
-    global preview_result, preview_root
-    preview_result = {}
+    global preview_result, preview_root, preview_page
+    preview_result = None
     preview_root = ""
+    preview_page = 0
+    ui_queue = queue.Queue()  # 工作线程 -> 界面线程的结果
+
+    def on_close():
+        if preview_result is not None:
+            preview_result.close()
+        window.destroy()
+
+    window.protocol("WM_DELETE_WINDOW", on_close)
+    window.after(UI_POLL_MS, poll_queue)
     window.mainloop()
+    # 窗口关闭前已经做完、还没来得及显示的预览，把临时数据库关掉
+    while not ui_queue.empty():
+        kind, value = ui_queue.get_nowait()
+        if kind == "preview":
+            value[0].close()
 
 # 主程序入口
 if __name__ == "__main__":
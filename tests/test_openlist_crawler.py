@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import threading
+import unittest
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+spec = importlib.util.spec_from_file_location("tree_to_strm", os.path.join(ROOT, "目录树转strm.py"))
+tree_to_strm = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tree_to_strm)
+
+
+class StubOpenlist:
+    """内存里的网盘目录树，模拟 /api/fs/list；目录修改时间只随直接子项变化。"""
+    def __init__(self):
+        self.dirs = {}
+        self.requests = []
+        self.clock = 0
+
+    def mkdir(self, path):
+        parent, name = path.rsplit('/', 1)
+        self.dirs[path] = {'modified': self._tick(), 'children': {}}
+        if parent in self.dirs:
+            self._add_child(parent, name, True)
+
+    def add_file(self, path):
+        parent, name = path.rsplit('/', 1)
+        self._add_child(parent, name, False)
+
+    def _add_child(self, parent, name, is_dir):
+        self.dirs[parent]['children'][name] = is_dir
+        self.dirs[parent]['modified'] = self._tick()
+
+    def _tick(self):
+        self.clock += 1
+        return f"2024-01-01T00:00:{self.clock:02d}Z"
+
+    def list(self, path):
+        self.requests.append(path)
+        content = [{'name': name, 'is_dir': is_dir,
+                    'modified': self.dirs[path + '/' + name]['modified'] if is_dir else None}
+                   for name, is_dir in sorted(self.dirs[path]['children'].items())]
+        return {'code': 200, 'data': {'content': content, 'total': len(content)}}
+
+
+class OpenlistCrawlerTest(unittest.TestCase):
+    def setUp(self):
+        self.stub = stub = StubOpenlist()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                data = json.dumps(stub.list(body['path'])).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+        for path in ('/115', '/115/TV', '/115/TV/Show', '/115/TV/Show/S1', '/115/TV/Other'):
+            stub.mkdir(path)
+        stub.add_file('/115/TV/Show/S1/e1.mkv')
+        stub.add_file('/115/TV/Other/o1.mp4')
+        self.cache = {}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def crawl(self):
+        crawler = tree_to_strm.OpenlistCrawler(self.base_url, '/115', cache=self.cache, max_concurrency=2)
+        return crawler, crawler.crawl()
+
+    def test_unchanged_tree_reuses_cached_listings(self):
+        _, first = self.crawl()
+        self.assertEqual(first, ['TV/Other/o1.mp4', 'TV/Show/S1/e1.mkv'])
+        crawler, second = self.crawl()
+        self.assertEqual(second, first)
+        self.assertGreater(crawler.skipped, 0)
+
+    def test_change_two_levels_below_cached_directory(self):
+        self.crawl()
+        self.stub.add_file('/115/TV/Show/S1/e2.mkv')
+        _, paths = self.crawl()
+        self.assertIn('TV/Show/S1/e2.mkv', paths)
+
+    def test_change_three_levels_below_cached_directory(self):
+        self.stub.mkdir('/115/TV/Show/S1/Extras')
+        self.crawl()
+        self.stub.add_file('/115/TV/Show/S1/Extras/x1.mkv')
+        _, paths = self.crawl()
+        self.assertIn('TV/Show/S1/Extras/x1.mkv', paths)
+
+    def test_removed_directory_drops_out_of_cache(self):
+        self.crawl()
+        del self.stub.dirs['/115/TV']['children']['Other']
+        self.stub.dirs['/115/TV']['modified'] = self.stub._tick()
+        _, paths = self.crawl()
+        self.assertEqual(paths, ['TV/Show/S1/e1.mkv'])
+        self.assertNotIn('/115/TV/Other', self.cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
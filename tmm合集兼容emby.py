@@ -3,8 +3,137 @@ import os
 import shutil
 import xml.etree.ElementTree as ET
 import configparser
+from concurrent.futures import ThreadPoolExecutor
 
 CONFIG_FILE = "config.ini"
+NFO_WORKERS = min(32, (os.cpu_count() or 4) * 4)
+
+# 生成新文件夹的方式：前三种都只改元数据，复制只作为明确选择的兜底
+LINK_MODES = {
+    "重命名（移动原文件夹，需同一文件系统）": "rename",
+    "硬链接镜像": "hardlink",
+    "符号链接镜像": "symlink",
+    "复制（慢，占用双倍空间）": "copy",
+}
+MODE_NAMES = {v: k for k, v in LINK_MODES.items()}
+
+def mirror_tree(src_folder, dst_folder, mode, copy_fallback=False):
+    """
+    按原目录结构在 dst_folder 建好文件夹，文件用硬链接或符号链接指回原文件；
+    原目录里的符号链接文件夹 os.walk 不会进去，镜像成指向同一目标的符号链接。
+    链接失败（硬链接跨盘、不允许建符号链接等）时只有 copy_fallback 为真才改为复制。返回改为复制的文件数
+    """
+    copied = 0
+    try:
+        for dirpath, dirnames, filenames in os.walk(src_folder):
+            target_dir = os.path.normpath(os.path.join(dst_folder, os.path.relpath(dirpath, src_folder)))
+            os.makedirs(target_dir, exist_ok=True)
+            for name in dirnames:
+                src = os.path.join(dirpath, name)
+                if not os.path.islink(src):
+                    continue
+                dst = os.path.join(target_dir, name)
+                try:
+                    os.symlink(os.path.realpath(src), dst, target_is_directory=True)
+                except OSError:
+                    if not copy_fallback:
+                        raise
+                    shutil.copytree(src, dst)
+                    copied += sum(len(files) for _, _, files in os.walk(dst))
+            for name in filenames:
+                src = os.path.join(dirpath, name)
+                dst = os.path.join(target_dir, name)
+                try:
+                    if mode == "symlink":
+                        os.symlink(os.path.abspath(src), dst)
+                    else:
+                        os.link(src, dst)
+                except OSError:
+                    if not copy_fallback:
+                        raise
+                    shutil.copy2(src, dst)
+                    copied += 1
+    except Exception:
+        # 镜像里只有链接和刚复制的文件，删掉不影响原文件
+        shutil.rmtree(dst_folder, ignore_errors=True)
+        raise
+    return copied
+
+def transfer_folder(src_folder, dst_folder, mode, copy_fallback=False):
+    """
+    按所选方式生成目标文件夹，返回实际使用的方式说明
+    """
+    if mode == "rename":
+        try:
+            os.rename(src_folder, dst_folder)
+        except OSError as e:
+            if not copy_fallback:
+                raise OSError(f"无法直接重命名（可能不在同一文件系统）：{e}") from e
+            shutil.copytree(src_folder, dst_folder)
+            return "复制（重命名失败后兜底）"
+        return "重命名"
+    if mode in ("hardlink", "symlink"):
+        copied = mirror_tree(src_folder, dst_folder, mode, copy_fallback)
+        name = "硬链接镜像" if mode == "hardlink" else "符号链接镜像"
+        return f"{name}（{copied} 个文件链接失败改为复制）" if copied else name
+    shutil.copytree(src_folder, dst_folder)
+    return "复制"
+
+def scan_collection_dirs(root_dir, max_depth=0):
+    """
+    找出所有含 collection.nfo 的文件夹。找到合集文件夹后不再往里走（里面都是电影文件夹、海报和花絮），
+    max_depth 大于 0 时最多往下走这么多层
+    """
+    found = []
+    stack = [(root_dir, 0)]
+    while stack:
+        path, depth = stack.pop()
+        subdirs = []
+        is_collection = False
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.name == 'collection.nfo' and entry.is_file():
+                        is_collection = True
+                        break
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+        except OSError:
+            continue
+        if is_collection:
+            found.append(path)
+        elif not max_depth or depth < max_depth:
+            stack.extend((d, depth + 1) for d in subdirs)
+    found.sort()
+    return found
+
+def parse_collection_nfo(nfo_path):
+    """
+    流式读取 collection.nfo 里根节点下的 title 和 tmdb id，两样都拿到就停止，不解析后面的电影列表
+    """
+    title = None
+    tmdbid = None
+    unique_tmdb = None
+    depth = 0
+    with open(nfo_path, 'rb') as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                if elem.tag == 'title' and title is None:
+                    title = elem.text or ''
+                elif elem.tag == 'tmdbid' and not tmdbid:
+                    tmdbid = elem.text
+                elif elem.tag == 'uniqueid' and elem.attrib.get('type') == 'tmdb' and not unique_tmdb:
+                    unique_tmdb = elem.text
+                elem.clear()
+                if title is not None and tmdbid:
+                    break
+            elif depth == 0:
+                break
+    return title, tmdbid or unique_tmdb
 
 class DragDropLineEdit(QtWidgets.QLineEdit):
     """
@@ -67,6 +196,30 @@ class FolderRenamer(QtWidgets.QWidget):
         output_layout.addWidget(self.output_btn)
         layout.addLayout(output_layout)
 
+        # 扫描深度，0 表示不限，找到合集文件夹后都不会再往里扫
+        depth_layout = QtWidgets.QHBoxLayout()
+        depth_layout.addWidget(QtWidgets.QLabel("扫描深度（0 为不限）："))
+        self.depth_spin = QtWidgets.QSpinBox()
+        self.depth_spin.setRange(0, 20)
+        self.depth_spin.valueChanged.connect(lambda _: self.save_config())
+        depth_layout.addWidget(self.depth_spin)
+        depth_layout.addStretch()
+        layout.addLayout(depth_layout)
+
+        # 生成方式
+        mode_layout = QtWidgets.QHBoxLayout()
+        mode_layout.addWidget(QtWidgets.QLabel("生成方式："))
+        self.mode_combo = QtWidgets.QComboBox()
+        self.mode_combo.addItems(list(LINK_MODES))
+        self.mode_combo.setCurrentText(MODE_NAMES["hardlink"])
+        self.mode_combo.currentTextChanged.connect(lambda _: self.save_config())
+        mode_layout.addWidget(self.mode_combo)
+        self.copy_fallback_check = QtWidgets.QCheckBox("失败时改为复制")
+        self.copy_fallback_check.stateChanged.connect(lambda _: self.save_config())
+        mode_layout.addWidget(self.copy_fallback_check)
+        mode_layout.addStretch()
+        layout.addLayout(mode_layout)
+
         # 预览和执行按钮
         btn_layout = QtWidgets.QHBoxLayout()
         self.preview_btn = QtWidgets.QPushButton("生成重命名预览")
@@ -106,6 +259,10 @@ class FolderRenamer(QtWidgets.QWidget):
             if output and os.path.isdir(output):
                 self.output_dir = output
                 self.output_dir_edit.setText(output)
+            self.depth_spin.setValue(config.getint("scan", "depth", fallback=0))
+            mode = config.get("transfer", "mode", fallback="hardlink")
+            self.mode_combo.setCurrentText(MODE_NAMES.get(mode, MODE_NAMES["hardlink"]))
+            self.copy_fallback_check.setChecked(config.getboolean("transfer", "copy_fallback", fallback=False))
 
     def save_config(self):
         config = configparser.ConfigParser()
@@ -113,6 +270,11 @@ class FolderRenamer(QtWidgets.QWidget):
             "root_dir": self.root_dir_edit.text(),
             "output_dir": self.output_dir_edit.text()
         }
+        config["scan"] = {"depth": str(self.depth_spin.value())}
+        config["transfer"] = {
+            "mode": LINK_MODES.get(self.mode_combo.currentText(), "hardlink"),
+            "copy_fallback": str(self.copy_fallback_check.isChecked()),
+        }
         with open(CONFIG_FILE, "w", encoding="utf-8") as f:
             config.write(f)
 
@@ -156,42 +318,45 @@ class FolderRenamer(QtWidgets.QWidget):
         root_dir = self.root_dir_edit.text()
         out_dir = self.output_dir_edit.text()
 
-        count = 0
-        for subdir, dirs, files in os.walk(root_dir):
-            if 'collection.nfo' in files:
-                try:
-                    rel_path = os.path.relpath(subdir, root_dir)
-                    old_folder_name = os.path.basename(rel_path)
+        collection_dirs = scan_collection_dirs(root_dir, self.depth_spin.value())
 
-                    tree = ET.parse(os.path.join(subdir, 'collection.nfo'))
-                    root = tree.getroot()
+        def parse(subdir):
+            try:
+                return parse_collection_nfo(os.path.join(subdir, 'collection.nfo')), None
+            except Exception as e:
+                return None, e
 
-                    title = root.findtext('title')
-                    tmdbid = root.findtext('tmdbid')
+        with ThreadPoolExecutor(max_workers=NFO_WORKERS) as pool:
+            results = list(pool.map(parse, collection_dirs))
 
-                    if not tmdbid:
-                        for uid in root.findall('uniqueid'):
-                            if uid.attrib.get('type') == 'tmdb':
-                                tmdbid = uid.text
-                                break
+        count = 0
+        for subdir, (parsed, error) in zip(collection_dirs, results):
+            if error is not None:
+                self.log.append(f"❌ 解析失败: {subdir} -> {str(error)}")
+                continue
+            try:
+                rel_path = os.path.relpath(subdir, root_dir)
+                old_folder_name = os.path.basename(rel_path)
 
-                    if not tmdbid:
-                        self.log.append(f"⚠️ 跳过 {title}，未找到 tmdb id")
-                        continue
+                title, tmdbid = parsed
 
-                    new_folder_name = f"{title}-tmdb-{tmdbid}"
-                    new_full_path = os.path.join(out_dir, os.path.dirname(rel_path), new_folder_name)
+                if not tmdbid:
+                    self.log.append(f"⚠️ 跳过 {title}，未找到 tmdb id")
+                    continue
 
-                    self.preview_list.append((subdir, new_full_path))
+                new_folder_name = f"{title}-tmdb-{tmdbid}"
+                new_full_path = os.path.join(out_dir, os.path.dirname(rel_path), new_folder_name)
 
-                    row = self.table.rowCount()
-                    self.table.insertRow(row)
-                    self.table.setItem(row, 0, QtWidgets.QTableWidgetItem(old_folder_name))
-                    self.table.setItem(row, 1, QtWidgets.QTableWidgetItem(new_folder_name))
+                self.preview_list.append((subdir, new_full_path))
 
-                    count += 1
-                except Exception as e:
-                    self.log.append(f"❌ 解析失败: {subdir} -> {str(e)}")
+                row = self.table.rowCount()
+                self.table.insertRow(row)
+                self.table.setItem(row, 0, QtWidgets.QTableWidgetItem(old_folder_name))
+                self.table.setItem(row, 1, QtWidgets.QTableWidgetItem(new_folder_name))
+
+                count += 1
+            except Exception as e:
+                self.log.append(f"❌ 解析失败: {subdir} -> {str(e)}")
 
         if count == 0:
             self.log.append("⚠️ 未找到任何有效合集或collection.nfo")
@@ -205,16 +370,19 @@ class FolderRenamer(QtWidgets.QWidget):
             self.log.append("❌ 请先生成重命名预览")
             return
 
+        mode = LINK_MODES.get(self.mode_combo.currentText(), "hardlink")
+        copy_fallback = self.copy_fallback_check.isChecked()
+
         count = 0
         for src_folder, dst_folder in self.preview_list:
             try:
                 os.makedirs(os.path.dirname(dst_folder), exist_ok=True)
                 if not os.path.exists(dst_folder):
-                    shutil.copytree(src_folder, dst_folder)
+                    used = transfer_folder(src_folder, dst_folder, mode, copy_fallback)
                     count += 1
                     old_name = os.path.basename(src_folder)
                     new_name = os.path.basename(dst_folder)
-                    self.log.append(f"✅ 已重命名: {old_name} → {new_name}")
+                    self.log.append(f"✅ 已重命名（{used}）: {old_name} → {new_name}")
                 else:
                     self.log.append(f"⚠️ 目标文件夹已存在，跳过: {dst_folder}")
             except Exception as e:
@@ -222,6 +390,9 @@ class FolderRenamer(QtWidgets.QWidget):
 
         self.log.append(f"\n🎉 总共重命名合集文件夹：{count} 个")
         self.process_btn.setEnabled(False)
+        if mode == "rename":
+            # 原文件夹已经搬走，预览作废
+            self.preview_list.clear()
 
 if __name__ == "__main__":
     import sys
@@ -4,9 +4,37 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import re
 import json
+import errno
+import queue
+import hashlib
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 CONFIG_FILE = "strm_config.json"
+HASH_CACHE_FILE = "strm_hash_cache.json"
+
+# 快速哈希只读文件头尾各这么多字节，小于两倍的文件直接算全量哈希
+PARTIAL_BYTES = 64 * 1024
+
+# 操作方式：界面显示名 -> 内部标识
+LINK_MODES = {
+    "复制": "copy",
+    "硬链接": "hardlink",
+    "reflink (写时复制)": "reflink",
+    "移动 (同盘)": "move",
+}
+MODE_NAMES = {v: k for k, v in LINK_MODES.items()}
+
+# Linux 的 FICLONE ioctl，btrfs / xfs 等文件系统上秒级完成整文件克隆
+FICLONE = 0x40049409
+
+# 跨盘或文件系统不支持时的错误码，遇到这些就退回普通复制
+FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOSYS}
 
 # 保存配置
 def save_config(data):
@@ -20,24 +48,307 @@ def load_config():
             return json.load(f)
     return {}
 
+# 季编号正则，模块加载时编译一次
+SEASON_PATTERN = re.compile(r"S(\d{2})|Season[ ._]?(\d{1,2})", re.IGNORECASE)
+
+# 并发处理文件的线程数
+COPY_WORKERS = min(16, (os.cpu_count() or 4) * 2)
+
+# 界面队列的刷新间隔（毫秒）
+UI_POLL_MS = 100
+
 # 提取季编号，格式化为 Season XX
 def extract_season(file):
-    match = re.search(r"S(\d{2})|Season[ ._]?(\d{1,2})", file, re.IGNORECASE)
+    match = SEASON_PATTERN.search(file)
     if match:
         season_num = match.group(1) or match.group(2)
         return f"Season {int(season_num):02d}"
     return "Season 未知"
 
-# 递归收集 .strm 文件
+def _reflink(src, dst):
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            if fcntl is None:
+                raise OSError(errno.EOPNOTSUPP, "不支持 FICLONE")
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS and e.errno != errno.ENOTTY:
+                raise
+            if not hasattr(os, "copy_file_range"):
+                raise OSError(errno.EOPNOTSUPP, "不支持 copy_file_range")
+            # 退到 copy_file_range，支持的文件系统上由内核在服务端完成复制
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if n == 0:
+                    break
+                remaining -= n
+    shutil.copystat(src, dst)
+
+# 先写到同目录的临时文件，成功后再改名成 dst，中途失败不会在目标位置留下半截文件
+def _write_via_temp(src, dst, writer):
+    tmp = f"{dst}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        writer(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+# 按指定方式把 src 放到 dst，跨盘或不支持时自动退回复制；返回实际使用的方式
+def transfer_file(src, dst, mode="copy"):
+    if mode != "copy":
+        try:
+            if mode == "hardlink":
+                os.link(src, dst)
+            elif mode == "reflink":
+                _write_via_temp(src, dst, _reflink)
+            elif mode == "move":
+                if os.stat(src).st_dev != os.stat(os.path.dirname(dst)).st_dev:
+                    raise OSError(errno.EXDEV, "跨设备")
+                os.replace(src, dst)
+            else:
+                raise ValueError(f"未知的操作方式: {mode}")
+            return mode
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS:
+                raise
+    _write_via_temp(src, dst, shutil.copy2)
+    return "copy"
+
+# 递归收集 .strm 文件，用 scandir 少一次 stat
 def collect_strm_files(folder):
     all_files = []
-    for root, _, files in os.walk(folder):
-        for f in files:
-            if f.lower().endswith(".strm"):
-                full_path = os.path.join(root, f)
-                all_files.append(full_path)
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(".strm"):
+                        all_files.append(entry.path)
+        except OSError:
+            continue
+    all_files.sort()
     return all_files
 
+# 文件哈希缓存：路径 -> {大小, 修改时间, 快速哈希, 全量哈希}，大小和修改时间没变就不用再读
+class HashCache:
+    def __init__(self, path=HASH_CACHE_FILE):
+        self.path = path
+        self.data = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                self.data = {}
+
+    def _hash(self, path, kind):
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        with self.lock:
+            entry = self.data.get(key)
+            # 大小或修改时间变了，旧哈希作废
+            if not entry or entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+                entry = None
+        if entry and entry.get(kind):
+            return entry[kind]
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            if kind == "partial" and st.st_size > PARTIAL_BYTES * 2:
+                h.update(f.read(PARTIAL_BYTES))
+                f.seek(-PARTIAL_BYTES, os.SEEK_END)
+                h.update(f.read(PARTIAL_BYTES))
+            else:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+        digest = h.hexdigest()
+        with self.lock:
+            entry = self.data.get(key)
+            if not entry or entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+                entry = self.data[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            entry[kind] = digest
+            # 小文件的快速哈希就是全量哈希
+            if st.st_size <= PARTIAL_BYTES * 2:
+                entry["partial"] = entry["full"] = digest
+        return digest
+
+    def partial(self, path):
+        return self._hash(path, "partial")
+
+    def full(self, path):
+        return self._hash(path, "full")
+
+    def save(self):
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+# 按内容找重复：同大小的文件先按头尾快速哈希分组，快速哈希撞上了再按全量哈希分组，全量哈希相同即为重复
+# 每个文件最多读一次头尾、一次全量，不用两两比较；大小独一份的文件一个字节都不读
+class ContentIndex:
+    def __init__(self, cache):
+        self.cache = cache
+        self.sizes = set()
+        self.unhashed = {}    # 大小 -> [(目标路径, 内容所在路径)]，还没算快速哈希
+        self.by_partial = {}  # (大小, 快速哈希) -> 还没算全量哈希的 [(目标路径, 内容所在路径)]
+        self.by_full = {}     # (大小, 全量哈希) -> 目标路径
+
+    def add(self, path, content_path, size):
+        self.sizes.add(size)
+        self.unhashed.setdefault(size, []).append((path, content_path))
+
+    # 返回和 src 内容相同的目标路径，没有则返回 None；src 读不了时抛 OSError，已有文件读不了就从索引里去掉
+    def find(self, src, size):
+        if size not in self.sizes:
+            return None
+        key = (size, self.cache.partial(src))
+        for path, content_path in self.unhashed.pop(size, []):
+            try:
+                self.by_partial.setdefault((size, self.cache.partial(content_path)), []).append((path, content_path))
+            except OSError:
+                pass
+        if key not in self.by_partial:
+            return None
+        full_key = (size, self.cache.full(src))
+        for path, content_path in self.by_partial[key]:
+            try:
+                self.by_full.setdefault((size, self.cache.full(content_path)), path)
+            except OSError:
+                pass
+        self.by_partial[key] = []
+        return self.by_full.get(full_key)
+
+# 目标名被不同内容占用时，改成 “名称 (2).strm” 这样的新名字
+def _free_name(dst, taken):
+    stem, ext = os.path.splitext(dst)
+    n = 2
+    while True:
+        candidate = f"{stem} ({n}){ext}"
+        if candidate not in taken:
+            return candidate
+        n += 1
+
+# 规划：去重并按目标季目录分组
+# 返回 ({季目录: [(源, 目标), ...]}, [(源, 跳过原因)], [(源, 原目标, 改名后目标)])
+def plan_transfers(pairs, cache=None):
+    cache = cache or HashCache()
+    by_dir = {}
+    for src, dst in pairs:
+        by_dir.setdefault(os.path.dirname(dst), []).append((src, dst))
+
+    groups, skipped, renamed = {}, [], []
+    for season_dir, items in by_dir.items():
+        # 目录里已有的文件和本次已接受的文件：{目标路径: (内容所在路径, 大小)}
+        taken = {}
+        if os.path.isdir(season_dir):
+            with os.scandir(season_dir) as it:
+                for entry in it:
+                    if entry.is_file():
+                        taken[entry.path] = (entry.path, entry.stat().st_size)
+        index = ContentIndex(cache)
+        for path, (content_path, size) in taken.items():
+            index.add(path, content_path, size)
+
+        for src, dst in items:
+            try:
+                size = os.path.getsize(src)
+                dup_of = index.find(src, size)
+            except OSError as e:
+                skipped.append((src, f"读取失败 {e}"))
+                continue
+            if dup_of:
+                skipped.append((src, f"内容相同 {dup_of}"))
+                continue
+            if dst in taken:
+                new_dst = _free_name(dst, taken)
+                renamed.append((src, dst, new_dst))
+                dst = new_dst
+            taken[dst] = (src, size)
+            index.add(dst, src, size)
+            groups.setdefault(season_dir, []).append((src, dst))
+    cache.save()
+    return groups, skipped, renamed
+
+# 只渲染可见行的列表，几十万行也不会卡；选中状态保存在 selected 里
+class VirtualList(ttk.Frame):
+    def __init__(self, master, width=90, height=12):
+        super().__init__(master)
+        self.rows = height
+        self.items = []
+        self.offset = 0
+        self.selected = set()
+        self.listbox = tk.Listbox(self, selectmode=tk.MULTIPLE, width=width, height=height,
+                                  exportselection=False, activestyle="none")
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<MouseWheel>", lambda e: self._scroll_by(-1 if e.delta > 0 else 1, 3))
+        self.listbox.bind("<Button-4>", lambda e: self._scroll_by(-1, 3))
+        self.listbox.bind("<Button-5>", lambda e: self._scroll_by(1, 3))
+        self.listbox.bind("<Up>", lambda e: self._scroll_by(-1, 1))
+        self.listbox.bind("<Down>", lambda e: self._scroll_by(1, 1))
+
+    def set_items(self, items):
+        self.items = items
+        self.offset = 0
+        self.selected.clear()
+        self._render()
+
+    def curselection(self):
+        return sorted(self.selected)
+
+    def _max_offset(self):
+        return max(0, len(self.items) - self.rows)
+
+    def _render(self):
+        self.listbox.delete(0, tk.END)
+        visible = self.items[self.offset:self.offset + self.rows]
+        if visible:
+            self.listbox.insert(tk.END, *visible)
+        for i in range(len(visible)):
+            if self.offset + i in self.selected:
+                self.listbox.select_set(i)
+        total = len(self.items)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.rows) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _scroll_by(self, direction, step):
+        self._scroll_to(self.offset + direction * step)
+        return "break"
+
+    def _scroll_to(self, offset):
+        offset = max(0, min(self._max_offset(), offset))
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def _on_scroll(self, *args):
+        if args[0] == "moveto":
+            self._scroll_to(int(float(args[1]) * len(self.items)))
+        elif args[0] == "scroll":
+            step = self.rows if args[2] == "pages" else 1
+            self._scroll_by(int(args[1]), step)
+
+    def _on_select(self, _event):
+        visible = range(self.offset, min(self.offset + self.rows, len(self.items)))
+        current = set(self.listbox.curselection())
+        for i, idx in enumerate(visible):
+            if i in current:
+                self.selected.add(idx)
+            else:
+                self.selected.discard(idx)
+
 class StrmOrganizerApp:
     def __init__(self, root):
         self.root = root
@@ -46,10 +357,13 @@ class StrmOrganizerApp:
 
         self.src_path = tk.StringVar(value=self.config.get("src_path", ""))
         self.dst_path = tk.StringVar(value=self.config.get("dst_path", ""))
+        self.link_mode = tk.StringVar(value=MODE_NAMES.get(self.config.get("link_mode", "copy"), "复制"))
 
         self.preview_data = []  # (src_path, dst_path)
+        self.ui_queue = queue.Queue()  # 工作线程 -> 主线程的界面更新
 
         self.setup_ui()
+        self.root.after(UI_POLL_MS, self._poll_queue)
 
     def setup_ui(self):
         frm = ttk.Frame(self.root, padding=10)
@@ -65,16 +379,20 @@ class StrmOrganizerApp:
         ttk.Entry(frm, textvariable=self.dst_path, width=50).grid(row=row, column=1)
         ttk.Button(frm, text="选择", command=self.select_dst).grid(row=row, column=2)
 
+        row += 1
+        ttk.Label(frm, text="操作方式:").grid(row=row, column=0, sticky='e')
+        ttk.Combobox(frm, textvariable=self.link_mode, values=list(LINK_MODES), state="readonly", width=20).grid(row=row, column=1, sticky='w')
+
         row += 1
         ttk.Button(frm, text="扫描并预览", command=self.preview_files).grid(row=row, column=1, pady=10)
 
         row += 1
         ttk.Label(frm, text="复制预览（可多选取消）:").grid(row=row, column=0, sticky='ne')
-        self.listbox = tk.Listbox(frm, selectmode=tk.MULTIPLE, width=90, height=12)
+        self.listbox = VirtualList(frm, width=90, height=12)
         self.listbox.grid(row=row, column=1, columnspan=2)
 
         row += 1
-        ttk.Button(frm, text="开始复制选中项", command=self.start_copy).grid(row=row, column=1, pady=10)
+        ttk.Button(frm, text="开始处理选中项", command=self.start_copy).grid(row=row, column=1, pady=10)
 
         row += 1
         ttk.Label(frm, text="操作日志:").grid(row=row, column=0, sticky="ne")
@@ -85,6 +403,8 @@ class StrmOrganizerApp:
         ttk.Label(frm, text="进度:").grid(row=row, column=0, sticky="e")
         self.progress = ttk.Progressbar(frm, length=300, mode="determinate")
         self.progress.grid(row=row, column=1, columnspan=2, sticky="w")
+        self.status = ttk.Label(frm, text="")
+        self.status.grid(row=row, column=2, sticky="e")
 
     def select_src(self):
         path = filedialog.askdirectory()
@@ -97,7 +417,6 @@ class StrmOrganizerApp:
             self.dst_path.set(path)
 
     def preview_files(self):
-        self.listbox.delete(0, tk.END)
         self.preview_data.clear()
 
         src = self.src_path.get()
@@ -109,43 +428,99 @@ class StrmOrganizerApp:
 
         files = collect_strm_files(src)
 
+        display = []
         for f in files:
-            season = extract_season(os.path.basename(f))
-            season_dir = os.path.join(dst, season)
-            target_path = os.path.join(season_dir, os.path.basename(f))
-            display = f"{f}  →  {target_path}"
-            self.listbox.insert(tk.END, display)
+            name = os.path.basename(f)
+            target_path = os.path.join(dst, extract_season(name), name)
+            display.append(f"{f}  →  {target_path}")
             self.preview_data.append((f, target_path))
+        self.listbox.set_items(display)
+        self.status.config(text=f"共 {len(display)} 个文件")
 
     def start_copy(self):
-        threading.Thread(target=self._copy_files).start()
-
-    def _copy_files(self):
+        # 选中项和操作方式在主线程里读取，工作线程不碰 Tk 控件
         selected_indices = self.listbox.curselection()
         if not selected_indices:
             selected_indices = list(range(len(self.preview_data)))
-
         to_copy = [self.preview_data[i] for i in selected_indices]
-        self.progress["maximum"] = len(to_copy)
+        mode = LINK_MODES.get(self.link_mode.get(), "copy")
+
+        self.progress["maximum"] = max(1, len(to_copy))
         self.progress["value"] = 0
         self.log_text.delete(1.0, tk.END)
+        save_config({"src_path": self.src_path.get(), "dst_path": self.dst_path.get(), "link_mode": mode})
+        threading.Thread(target=self._copy_files, args=(to_copy, mode), daemon=True).start()
+
+    def _transfer_one(self, src, dst, mode):
+        try:
+            if os.path.exists(dst):
+                return 0, f"跳过: 已存在 {dst}"
+            used = transfer_file(src, dst, mode)
+            if used != mode:
+                return 1, f"{MODE_NAMES[used]}（{MODE_NAMES[mode]}不可用）: {src} → {dst}"
+            return 1, f"{MODE_NAMES[used]}: {src} → {dst}"
+        except Exception as e:
+            return 0, f"失败: {src} → {e}"
 
+    def _copy_files(self, to_copy, mode):
         copied = 0
-        for i, (src, dst) in enumerate(to_copy):
-            self.progress["value"] = i + 1
-            os.makedirs(os.path.dirname(dst), exist_ok=True)
-            try:
-                if not os.path.exists(dst):
-                    shutil.copy2(src, dst)
-                    self.log(f"复制: {src} → {dst}")
-                    copied += 1
-                else:
-                    self.log(f"跳过: 已存在 {dst}")
-            except Exception as e:
-                self.log(f"失败: {src} → {e}")
-
-        save_config({"src_path": self.src_path.get(), "dst_path": self.dst_path.get()})
-        messagebox.showinfo("完成", f"共复制 {copied} 个文件。")
+        # 比对或复制中途出错也要发出 done，否则按钮一直是禁用状态
+        try:
+            self.ui_queue.put(("log", "正在比对重复文件..."))
+            groups, skipped, renamed = plan_transfers(to_copy)
+            for src, reason in skipped:
+                self.ui_queue.put(("log", f"跳过: {src}（{reason}）"))
+            for src, old_dst, new_dst in renamed:
+                self.ui_queue.put(("log", f"重名改为: {os.path.basename(old_dst)} → {os.path.basename(new_dst)}（{src}）"))
+            self.ui_queue.put(("log", f"去重完成：跳过重复 {len(skipped)} 个，重名改名 {len(renamed)} 个。"))
+
+            done = len(skipped)
+            with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+                futures = []
+                # 每个季目录只创建一次
+                for season_dir, pairs in groups.items():
+                    try:
+                        os.makedirs(season_dir, exist_ok=True)
+                    except OSError as e:
+                        self.ui_queue.put(("log", f"失败: 无法创建目录 {season_dir} → {e}"))
+                        done += len(pairs)
+                        continue
+                    futures.extend(executor.submit(self._transfer_one, src, dst, mode) for src, dst in pairs)
+                for fut in as_completed(futures):
+                    ok, msg = fut.result()
+                    copied += ok
+                    done += 1
+                    self.ui_queue.put(("log", msg))
+                    self.ui_queue.put(("progress", done))
+        except Exception as e:
+            self.ui_queue.put(("log", f"出错中止: {e}"))
+        finally:
+            self.ui_queue.put(("done", copied))
+
+    # 主线程定时批量处理队列里的界面更新
+    def _poll_queue(self):
+        lines = []
+        progress = None
+        finished = None
+        try:
+            while True:
+                kind, value = self.ui_queue.get_nowait()
+                if kind == "log":
+                    lines.append(value)
+                elif kind == "progress":
+                    progress = value
+                elif kind == "done":
+                    finished = value
+        except queue.Empty:
+            pass
+        if lines:
+            self.log("\n".join(lines))
+        if progress is not None:
+            self.progress["value"] = progress
+            self.status.config(text=f"{progress}/{int(self.progress['maximum'])}")
+        if finished is not None:
+            messagebox.showinfo("完成", f"共处理 {finished} 个文件。")
+        self.root.after(UI_POLL_MS, self._poll_queue)
 
     def log(self, text):
         self.log_text.insert(tk.END, text + "\n")
@@ -1,17 +1,36 @@
 import os
 import re
-import chardet
+import json
+import codecs
+import hashlib
+import queue
+import shutil
+import tempfile
+import itertools
+import threading
+from array import array
+from collections import OrderedDict
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, scrolledtext
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from 编码检测 import detect_encoding
 
-def detect_encoding(file_path):
-    with open(file_path, 'rb') as f:
-        rawdata = f.read(10000)  # 读取前1万字节检测编码
-    result = chardet.detect(rawdata)
-    return result['encoding'] or 'utf-8'
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SUPPORTED_FORMATS = ('srt', 'vtt', 'ass', 'ssa')
 
 def format_timestamp(ms_total, fmt):
+    if fmt in ('ass', 'ssa'):
+        # ass 只精确到百分之一秒，四舍五入
+        h, rem = divmod((ms_total + 5) // 10, 360000)
+        m, rem = divmod(rem, 6000)
+        s, cs = divmod(rem, 100)
+        return f'{h:d}:{m:02d}:{s:02d}.{cs:02d}'
+
     h, rem = divmod(ms_total, 3600000)
     m, rem = divmod(rem, 60000)
     s, ms = divmod(rem, 1000)
@@ -30,59 +49,444 @@ def parse_time_to_ms(timestamp, fmt):
     elif fmt == 'vtt':
         h, m, s_ms = timestamp.split(':')
         s, ms = s_ms.split('.')
+    elif fmt in ('ass', 'ssa'):
+        h, m, s_cs = timestamp.split(':')
+        s, cs = s_cs.split('.')
+        ms = int(cs) * 10
     else:
         raise ValueError("不支持的字幕格式")
     return int(h)*3600000 + int(m)*60000 + int(s)*1000 + int(ms)
 
-def shift_timestamp_line(line, shift_ms, fmt):
-    start, end = line.strip().split(' --> ')
-    start_ms = parse_time_to_ms(start, fmt) + shift_ms
-    end_ms = parse_time_to_ms(end, fmt) + shift_ms
-
-    start_ms = max(start_ms, 0)
-    end_ms = max(end_ms, 0)
-
-    return f"{format_timestamp(start_ms, fmt)} --> {format_timestamp(end_ms, fmt)}\n"
-
-def process_subtitle(file_path, shift_seconds, output_dir):
+# 时间轴的写法：第1组是时间前面原样保留的部分，2-9组是起止时间的时分秒和毫秒（ass 为百分之一秒），
+# 匹配结束位置之后（vtt 的位置设置、ass 的样式和正文）原样保留
+CUE_TIMING = r'^([ \t]*)(\d+):(\d{2}):(\d{2})[,.](\d{3})[ \t]*-->[ \t]*(\d+):(\d{2}):(\d{2})[,.](\d{3})'
+# ass/ssa 改 Dialogue 和 Comment 事件行（注释事件也要跟着移，否则和对白错开），第一个字段是层号（ssa 为 Marked=0）
+ASS_TIMING = r'^((?:Dialogue|Comment):[ \t]*[^,]*,)(\d+):(\d{2}):(\d{2})\.(\d{2}),(\d+):(\d{2}):(\d{2})\.(\d{2})(?=,)'
+TIMING_PATTERNS = {}
+for _fmt in SUPPORTED_FORMATS:
+    _pattern = ASS_TIMING if _fmt in ('ass', 'ssa') else CUE_TIMING
+    TIMING_PATTERNS[_fmt, False] = re.compile(_pattern)
+    TIMING_PATTERNS[_fmt, True] = re.compile(_pattern.encode('ascii'))
+# 先用子串粗筛，绝大多数正文行不用跑正则；ass/ssa 的两种事件行只有冒号是共同的
+TIMING_MARKERS = {'srt': '-->', 'vtt': '-->', 'ass': ':', 'ssa': ':'}
+MODEL_CACHE_SIZE = 256
+STREAM_BLOCK_LINES = 4096
+
+def _match_times(m, fmt):
+    g = [int(x) for x in m.groups()[1:9]]
+    unit = 10 if fmt in ('ass', 'ssa') else 1
+    return (g[0] * 3600000 + g[1] * 60000 + g[2] * 1000 + g[3] * unit,
+            g[4] * 3600000 + g[5] * 60000 + g[6] * 1000 + g[7] * unit)
+
+def _timing_core(start_ms, end_ms, fmt):
+    sep = ',' if fmt in ('ass', 'ssa') else ' --> '
+    return f"{format_timestamp(start_ms, fmt)}{sep}{format_timestamp(end_ms, fmt)}"
+
+# 字幕文件解析一次后的紧凑模型：起止毫秒放在两个整数数组里，文本保留原始行，只记时间轴所在的行号
+class SubtitleDocument:
+    __slots__ = ("path", "fmt", "encoding", "lines", "cue_line", "start", "end")
+
+    def __init__(self, path, fmt, encoding, lines):
+        self.path = path
+        self.fmt = fmt
+        self.encoding = encoding
+        self.lines = lines
+        self.cue_line = array('l')
+        self.start = array('q')
+        self.end = array('q')
+        pattern = TIMING_PATTERNS[fmt, False]
+        marker = TIMING_MARKERS[fmt]
+        for idx, line in enumerate(lines):
+            if marker not in line:
+                continue
+            m = pattern.match(line)
+            if not m:
+                continue
+            start, end = _match_times(m, fmt)
+            self.cue_line.append(idx)
+            self.start.append(start)
+            self.end.append(end)
+
+    @classmethod
+    def load(cls, file_path):
+        fmt = os.path.splitext(file_path)[-1].lower().lstrip('.')
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+        encoding = detect_encoding(file_path, raw)
+        text = raw.decode(encoding, errors='ignore')
+        return cls(file_path, fmt, encoding, text.splitlines(keepends=True))
+
+    def __len__(self):
+        return len(self.cue_line)
+
+    def timing_text(self, i, start_ms, end_ms):
+        line = self.lines[self.cue_line[i]]
+        m = TIMING_PATTERNS[self.fmt, False].match(line)
+        return (m.group(1) + _timing_core(start_ms, end_ms, self.fmt) + line[m.end():]).strip()
+
+    def transformed(self, transform):
+        return transform.apply(self.start), transform.apply(self.end)
+
+    # 原时间轴 -> 新时间轴的文本对，limit 为 None 时列出全部
+    def preview(self, start, end, limit=None):
+        count = len(self) if limit is None else min(limit, len(self))
+        return [(self.lines[self.cue_line[i]].strip(), self.timing_text(i, start[i], end[i])) for i in range(count)]
+
+# UTF-16/32 里时间数字不是单字节，只能解码后处理
+def _is_ascii_compatible(encoding):
+    return not codecs.lookup(encoding).name.startswith(('utf-16', 'utf-32'))
+
+# 流式改写：每次读一块行，块内时间轴批量变换后就地替换，其余行原样写出，内存占用和文件大小无关
+# ASCII 兼容的编码直接在字节上匹配和替换，正文不解码也不重新编码；先写临时文件再原子替换
+# 输出要照搬源文件的全部字节，所以这里总会把源文件再顺序读一遍，不复用预览时解析出的条目：
+# 把整份解析结果传给进程反而要序列化全部内容，内存也不再和文件大小无关；省掉的是重复的自动对齐，见 process_chunk
+def rewrite_subtitle(src_path, out_path, transform, fmt=None):
+    fmt = fmt or os.path.splitext(src_path)[-1].lower().lstrip('.')
+    encoding = detect_encoding(src_path)
+    binary = _is_ascii_compatible(encoding)
+    pattern = TIMING_PATTERNS[fmt, binary]
+    marker = TIMING_MARKERS[fmt].encode('ascii') if binary else TIMING_MARKERS[fmt]
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    if binary:
+        fin = open(src_path, 'rb')
+    else:
+        fin = open(src_path, 'r', encoding=encoding, newline='')
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix='.' + os.path.basename(out_path) + '.', suffix='.tmp')
+    cue_index = 0
+    try:
+        with fin, (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding=encoding, newline='')) as fout:
+            while True:
+                block = list(itertools.islice(fin, STREAM_BLOCK_LINES))
+                if not block:
+                    break
+                hits = []
+                for i, line in enumerate(block):
+                    if marker in line:
+                        m = pattern.match(line)
+                        if m:
+                            hits.append((i, m))
+                if hits:
+                    times = [_match_times(m, fmt) for _, m in hits]
+                    starts = transform.apply(array('q', (t[0] for t in times)), cue_index)
+                    ends = transform.apply(array('q', (t[1] for t in times)), cue_index)
+                    for k, (i, m) in enumerate(hits):
+                        core = _timing_core(starts[k], ends[k], fmt)
+                        if binary:
+                            core = core.encode('ascii')
+                        line = block[i]
+                        block[i] = m.group(1) + core + line[m.end():]
+                    cue_index += len(hits)
+                fout.writelines(block)
+            fout.flush()
+            os.fsync(fout.fileno())
+        # mkstemp 建的文件是 0600，换上源文件的权限，不然以其他用户运行的 Emby 读不了
+        shutil.copymode(src_path, tmp_path)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return cue_index
+
+# 分段线性变换 t' = a*t + b（毫秒），segments 为 [(起始条目下标, a, b)]，一段一直用到下一段开始
+# 有 numpy 时整段向量化，没有就逐个算；结果小于 0 的截到 0，和原来的平移一致
+class TimeTransform:
+    def __init__(self, segments):
+        # 只按起始条目排序，同一条目出现两次时哪段生效说不清，直接报错
+        segments = sorted(segments, key=lambda seg: seg[0])
+        for prev, seg in zip(segments, segments[1:]):
+            if prev[0] == seg[0]:
+                hint = "（第1条的偏移请填在整体偏移里）" if seg[0] == 0 else ""
+                raise ValueError(f"分段起始条目重复: 第{seg[0] + 1}条{hint}")
+        if not segments or segments[0][0] > 0:
+            segments.insert(0, (0, 1.0, 0.0))
+        self.segments = segments
+
+    @classmethod
+    def shift(cls, shift_seconds, scale=1.0):
+        return cls([(0, scale, int(shift_seconds * 1000))])
+
+    # 缩放系数可以直接写小数，也可以写 "25/23.976" 这样的帧率比
+    @staticmethod
+    def parse_scale(text):
+        text = text.strip()
+        if not text:
+            return 1.0
+        if '/' in text:
+            num, den = text.split('/', 1)
+            return float(num) / float(den)
+        return float(text)
+
+    # 分段写法："120:+3.5; 300:-1*25/23.976"，表示从第120条（从1数）起偏移3.5秒，从第300条起偏移-1秒并缩放
+    @classmethod
+    def parse(cls, shift_text, scale_text="", segments_text=""):
+        scale = cls.parse_scale(scale_text)
+        segments = [(0, scale, int(float(shift_text or 0) * 1000))]
+        for part in re.split(r'[;；\n]', segments_text):
+            part = part.strip()
+            if not part:
+                continue
+            cue, rest = part.split(':', 1)
+            offset, _, seg_scale = rest.partition('*')
+            index = int(cue) - 1
+            if index < 0:
+                raise ValueError(f"分段起始条目必须从1开始: {part}")
+            segments.append((index, cls.parse_scale(seg_scale) if seg_scale else scale, int(float(offset) * 1000)))
+        return cls(segments)
+
+    # 写进清单用的唯一标识，参数一样的变换得到同一个字符串
+    def key(self):
+        return json.dumps([[index, round(a, 9), b] for index, a, b in self.segments])
+
+    def __str__(self):
+        parts = []
+        for index, a, b in self.segments:
+            desc = f"偏移 {b / 1000:g} 秒" + (f" 缩放 {a:.6g}" if a != 1 else "")
+            parts.append(desc if index == 0 else f"第{index + 1}条起{desc}")
+        return "，".join(parts)
+
+    # times 是第 first_index 条起的一段时间，流式处理时分块调用
+    def apply(self, times, first_index=0):
+        n = len(times)
+        ranges = []
+        bounds = [seg[0] for seg in self.segments[1:]] + [first_index + n]
+        for (lo, a, b), hi in zip(self.segments, bounds):
+            lo = min(max(lo - first_index, 0), n)
+            hi = min(max(hi - first_index, 0), n)
+            if lo < hi:
+                ranges.append((lo, hi, a, b))
+        if np is not None:
+            src = np.frombuffer(times, dtype=np.int64) if n else np.zeros(0, dtype=np.int64)
+            out = np.empty_like(src)
+            for lo, hi, a, b in ranges:
+                chunk = src[lo:hi]
+                if a == 1:
+                    out[lo:hi] = chunk + int(b)
+                else:
+                    out[lo:hi] = np.rint(chunk * a + b).astype(np.int64)
+            np.maximum(out, 0, out=out)
+            result = array('q')
+            result.frombytes(out.tobytes())
+            return result
+        result = array('q')
+        for lo, hi, a, b in ranges:
+            if a == 1:
+                b = int(b)
+                result.extend(t + b if t + b > 0 else 0 for t in times[lo:hi])
+            else:
+                result.extend(max(int(round(t * a + b)), 0) for t in times[lo:hi])
+        return result
+
+SYNC_BIN_MS = 20                  # 时间轴栅格化的精度
+SYNC_MAX_OFFSET_MS = 10 * 60000   # 只在 ±10 分钟内找偏移
+# 检测缩放时尝试的常见帧率换算
+SYNC_SCALES = (1.0, 25 / 23.976, 23.976 / 25, 24 / 23.976, 23.976 / 24, 25 / 24, 24 / 25)
+
+# 把有台词的时间段画到 0/1 时间轴上，用差分数组一次性填充
+def rasterize_cues(start, end, length, bin_ms=SYNC_BIN_MS):
+    s = np.clip(np.asarray(start, dtype=np.float64) // bin_ms, 0, length).astype(np.int64)
+    e = np.clip(np.asarray(end, dtype=np.float64) // bin_ms, 0, length).astype(np.int64)
+    diff = np.zeros(length + 1, dtype=np.int32)
+    np.add.at(diff, s, 1)
+    np.add.at(diff, e, -1)
+    return (np.cumsum(diff[:length]) > 0).astype(np.float64)
+
+# 用 FFT 互相关找让字幕与参考字幕台词区间重合最多的偏移（可选同时挑缩放），返回 (TimeTransform, 重合率)
+def detect_transform(doc, ref_doc, detect_scale=False, max_offset_ms=SYNC_MAX_OFFSET_MS):
+    if np is None:
+        raise RuntimeError("自动对齐需要安装 numpy")
+    if not len(doc) or not len(ref_doc):
+        raise ValueError("字幕或参考字幕中没有时间轴")
+    start = np.frombuffer(doc.start, dtype=np.int64)
+    end = np.frombuffer(doc.end, dtype=np.int64)
+    scales = SYNC_SCALES if detect_scale else (1.0,)
+    longest = max(int(end.max() * max(scales)), max(ref_doc.end)) // SYNC_BIN_MS + 1
+    # 超过时间轴长度的偏移没有意义；FFT 长度要容下 longest + max_bins，正负两侧的窗口才不会绕回来重叠
+    max_bins = min(max_offset_ms // SYNC_BIN_MS, longest - 1)
+    n_fft = 1 << int(longest + max_bins).bit_length()
+
+    ref = rasterize_cues(ref_doc.start, ref_doc.end, longest)
+    ref_spec = np.fft.rfft(ref, n_fft)
+    ref_total = float(ref.sum())
+    best = None
+    for scale in scales:
+        sub = rasterize_cues(start * scale, end * scale, longest)
+        # corr[k] = Σ ref[t+k]·sub[t]，k 为正表示字幕要往后挪
+        corr = np.fft.irfft(ref_spec * np.conj(np.fft.rfft(sub, n_fft)), n_fft)
+        lags = np.concatenate((corr[:max_bins + 1], corr[n_fft - max_bins:]))
+        idx = int(np.argmax(lags))
+        lag = idx if idx <= max_bins else idx - (2 * max_bins + 1)
+        overlap = float(lags[idx]) / max(min(float(sub.sum()), ref_total), 1.0)
+        if best is None or overlap > best[0] + 1e-6:
+            best = (overlap, scale, lag)
+    overlap, scale, lag = best
+    # 落在搜索窗口边缘说明真正的峰值在窗口外，这个结果不可信
+    if max_bins and abs(lag) >= max_bins:
+        raise ValueError("检测到的偏移超出搜索范围，参考字幕可能不是同一集")
+    return TimeTransform([(0, scale, lag * SYNC_BIN_MS)]), overlap
+
+EPISODE_KEY_PATTERN = re.compile(r'[Ss](\d{1,2})[Ee](\d{1,4})|[Ee][Pp]?(\d{1,4})|第(\d+)[集话話]')
+
+# 参考字幕配对：优先按 S01E02 / EP02 / 第2集 认集数，认不出再按去掉语言后缀的文件名
+def subtitle_match_key(path):
+    name = os.path.basename(path)
+    m = EPISODE_KEY_PATTERN.search(name)
+    if m:
+        if m.group(1):
+            return ("ep", int(m.group(1)), int(m.group(2)))
+        return ("ep", None, int(m.group(3) or m.group(4)))
+    return ("name", name.split('.')[0].lower())
+
+def find_reference(file_path, ref_files):
+    key = subtitle_match_key(file_path)
+    for ref in ref_files:
+        if os.path.abspath(ref) == os.path.abspath(file_path):
+            continue
+        ref_key = subtitle_match_key(ref)
+        if ref_key == key or (key[0] == "ep" and ref_key[0] == "ep" and None in (key[1], ref_key[1])
+                              and key[2] == ref_key[2]):
+            return ref
+    return None
+
+_model_cache = OrderedDict()
+_model_lock = threading.Lock()
+
+# 按 (路径, 大小, 修改时间) 缓存解析结果，预览过的文件应用时不再重复解析
+def load_subtitle(file_path):
+    st = os.stat(file_path)
+    key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+    with _model_lock:
+        doc = _model_cache.get(key)
+        if doc is not None:
+            _model_cache.move_to_end(key)
+            return doc
+    doc = SubtitleDocument.load(file_path)
+    with _model_lock:
+        _model_cache[key] = doc
+        while len(_model_cache) > MODEL_CACHE_SIZE:
+            _model_cache.popitem(last=False)
+    return doc
+
+# transform 可以是秒数，也可以是 TimeTransform；返回 (改动的时间轴条数, 错误)
+def process_subtitle(file_path, transform, output_dir):
     fmt = os.path.splitext(file_path)[-1].lower().lstrip('.')
-    if fmt not in ['srt', 'vtt']:
+    if fmt not in SUPPORTED_FORMATS:
         return None, "不支持的字幕格式"
 
-    encoding = detect_encoding(file_path)
-
-    with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-        lines = f.readlines()
-
-    shift_ms = int(shift_seconds * 1000)
-    output_lines = []
-    preview_changes = []  # 用于预览原时间->新时间
-
-    for line in lines:
-        if '-->' in line:
-            try:
-                old_line = line.strip()
-                new_line = shift_timestamp_line(line, shift_ms, fmt).strip()
-                output_lines.append(new_line + '\n')
-                preview_changes.append((old_line, new_line))
-            except Exception as e:
-                output_lines.append(line)
-        else:
-            output_lines.append(line)
+    if not isinstance(transform, TimeTransform):
+        transform = TimeTransform.shift(transform)
 
     # 输出路径
     base_name = os.path.basename(file_path)
     out_path = os.path.join(output_dir, base_name)
-    with open(out_path, 'w', encoding='utf-8') as f:
-        f.writelines(output_lines)
-
-    return preview_changes, None
+    return rewrite_subtitle(file_path, out_path, transform, fmt), None
+
+PROCESS_WORKERS = os.cpu_count() or 2
+BATCH_CHUNK = 32       # 每个进程任务处理的文件数，太小进程间通信占大头
+UI_POLL_MS = 100
+
+MANIFEST_NAME = ".subtitle_shift_manifest.json"
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+# 输出目录里的处理清单：源文件（路径、大小、修改时间、哈希）-> 用过的变换和输出文件的哈希
+# 源文件和变换都没变、输出也还在的文件，重跑时直接跳过
+class ShiftManifest:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = {}
+        self.dirty = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def lookup(self, src):
+        return self.entries.get(os.path.abspath(src))
+
+    def is_current(self, src, transform_key):
+        entry = self.lookup(src)
+        if not entry or entry.get("transform") != transform_key:
+            return False
+        out_path = os.path.join(self.output_dir, os.path.basename(src))
+        try:
+            st = os.stat(src)
+            out_st = os.stat(out_path)
+        except OSError:
+            return False
+        if out_st.st_size != entry.get("output_size") or st.st_size != entry.get("size"):
+            return False
+        if st.st_mtime_ns != entry.get("mtime_ns"):
+            # 只是修改时间变了（被复制、touch 过），内容相同也算没变
+            if file_hash(src) != entry.get("hash"):
+                return False
+            entry["mtime_ns"] = st.st_mtime_ns
+            self.dirty = True
+        if out_st.st_mtime_ns != entry.get("output_mtime_ns"):
+            # 输出文件被改过（大小可能恰好一样），按内容确认还是这次写出的结果
+            if file_hash(out_path) != entry.get("output_hash"):
+                return False
+            entry["output_mtime_ns"] = out_st.st_mtime_ns
+            self.dirty = True
+        return True
+
+    def update(self, src, record):
+        self.entries[os.path.abspath(src)] = record
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+# 自动对齐结果的标识，由参考字幕和是否检测缩放决定，参考字幕没变就不用重新对齐
+def auto_sync_key(ref, detect_scale):
+    ref_st = os.stat(ref)
+    return json.dumps(["auto", os.path.abspath(ref), ref_st.st_size, ref_st.st_mtime_ns, detect_scale])
+
+# 进程池里跑的一批任务：task 为 (字幕路径, 变换或 None, 参考字幕, 是否检测缩放, 清单里的变换标识)，变换为 None 时先自动对齐
+# 返回 [(路径, 错误, 变换说明, 清单记录)]
+def process_chunk(tasks, output_dir):
+    results = []
+    for path, transform, ref, detect_scale, transform_key in tasks:
+        try:
+            st = os.stat(path)
+            src_hash = file_hash(path)
+            if transform is None:
+                transform, _ = detect_transform(load_subtitle(path), load_subtitle(ref), detect_scale)
+            _, err = process_subtitle(path, transform, output_dir)
+            record = None
+            if not err:
+                out_path = os.path.join(output_dir, os.path.basename(path))
+                out_st = os.stat(out_path)
+                record = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": src_hash,
+                          "transform": transform_key, "applied": str(transform),
+                          "output_hash": file_hash(out_path), "output_size": out_st.st_size,
+                          "output_mtime_ns": out_st.st_mtime_ns,
+                          "ts": datetime.now().isoformat(timespec='seconds')}
+            results.append((path, err, str(transform), record))
+        except Exception as e:
+            results.append((path, str(e), "", None))
+    return results
 
 def scan_subtitles(root_dir):
     matches = []
     for root, _, files in os.walk(root_dir):
         for f in files:
-            if f.lower().endswith(('.srt', '.vtt')):
+            if f.lower().endswith(tuple('.' + fmt for fmt in SUPPORTED_FORMATS)):
                 matches.append(os.path.join(root, f))
     return matches
 
@@ -116,6 +520,26 @@ class SubtitleShiftApp:
         tk.Label(frame_shift, text="时间偏移（秒，支持正负）：").pack(side=tk.LEFT)
         self.entry_shift = tk.Entry(frame_shift, width=10)
         self.entry_shift.pack(side=tk.LEFT, padx=5)
+        tk.Label(frame_shift, text="缩放系数（如 1.001 或 25/23.976）：").pack(side=tk.LEFT)
+        self.entry_scale = tk.Entry(frame_shift, width=14)
+        self.entry_scale.pack(side=tk.LEFT, padx=5)
+
+        # 自动对齐
+        frame_sync = tk.Frame(root)
+        frame_sync.pack(fill=tk.X, padx=10, pady=5)
+        self.auto_sync_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame_sync, text="按参考字幕自动对齐，参考字幕文件夹：", variable=self.auto_sync_var).pack(side=tk.LEFT)
+        self.entry_reference = tk.Entry(frame_sync)
+        self.entry_reference.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        tk.Button(frame_sync, text="选择", command=self.select_reference_dir).pack(side=tk.LEFT)
+        self.detect_scale_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame_sync, text="同时检测帧率缩放", variable=self.detect_scale_var).pack(side=tk.LEFT, padx=5)
+
+        frame_segments = tk.Frame(root)
+        frame_segments.pack(fill=tk.X, padx=10, pady=5)
+        tk.Label(frame_segments, text="分段调整（第N条起:偏移秒[*缩放]，分号分隔，如 120:+3.5; 300:-1）：").pack(side=tk.LEFT)
+        self.entry_segments = tk.Entry(frame_segments)
+        self.entry_segments.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
 
         # 文件列表
         frame_list = tk.Frame(root)
@@ -147,7 +571,20 @@ class SubtitleShiftApp:
 
         tk.Button(frame_btn, text="扫描字幕文件", command=self.scan_files).pack(side=tk.LEFT)
         tk.Button(frame_btn, text="预览选中文件", command=self.preview_selected).pack(side=tk.LEFT, padx=10)
-        tk.Button(frame_btn, text="开始批量处理", command=self.batch_process).pack(side=tk.LEFT)
+        self.btn_batch = tk.Button(frame_btn, text="开始批量处理", command=self.batch_process)
+        self.btn_batch.pack(side=tk.LEFT)
+        self.btn_cancel = tk.Button(frame_btn, text="取消处理", command=self.cancel_batch, state=tk.DISABLED)
+        self.btn_cancel.pack(side=tk.LEFT, padx=10)
+        self.skip_done_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(frame_btn, text="跳过已按相同设置处理过的文件", variable=self.skip_done_var).pack(side=tk.LEFT)
+        self.label_status = tk.Label(frame_btn, text="")
+        self.label_status.pack(side=tk.LEFT, padx=10)
+
+        self.result_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.batch_state = None
+        # 预览时自动对齐得到的变换 {路径: (大小, 修改时间, 对齐标识, 变换)}，批量处理时字幕和参考都没变就直接用
+        self.detected = {}
 
         # 日志文件路径
         self.log_path = os.path.join(os.getcwd(), "字幕时间轴调整日志.log")
@@ -164,15 +601,33 @@ class SubtitleShiftApp:
             self.entry_output.delete(0, tk.END)
             self.entry_output.insert(0, folder)
 
+    def select_reference_dir(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.entry_reference.delete(0, tk.END)
+            self.entry_reference.insert(0, folder)
+
     def scan_files(self):
         input_dir = self.entry_input.get().strip()
         if not os.path.isdir(input_dir):
             messagebox.showerror("错误", "请输入有效的字幕文件夹路径")
             return
         files = scan_subtitles(input_dir)
+        output_dir = self.entry_output.get().strip()
+        manifest = ShiftManifest(output_dir) if os.path.isdir(output_dir) else None
         self.tree.delete(*self.tree.get_children())
         for f in files:
-            self.tree.insert("", "end", iid=f, text="", values=(f, "未预览"))
+            # 清单里有记录且源文件大小、修改时间没变的，标出上次用的变换
+            entry = manifest.lookup(f) if manifest else None
+            status = "未预览"
+            if entry:
+                try:
+                    st = os.stat(f)
+                    if (st.st_size, st.st_mtime_ns) == (entry.get("size"), entry.get("mtime_ns")):
+                        status = f"已处理（{entry.get('applied', '')}）"
+                except OSError:
+                    pass
+            self.tree.insert("", "end", iid=f, text="", values=(f, status))
             # 默认选中
             self.tree.selection_add(f)
         messagebox.showinfo("完成", f"扫描到 {len(files)} 个字幕文件")
@@ -182,89 +637,229 @@ class SubtitleShiftApp:
         if not selected:
             messagebox.showwarning("提示", "请先选择至少一个字幕文件")
             return
-        shift_str = self.entry_shift.get().strip()
-        try:
-            shift_sec = float(shift_str)
-        except:
-            messagebox.showerror("错误", "请输入有效的数字时间偏移")
+        transforms = self.transforms_for(selected)
+        if transforms is None:
             return
 
         self.text_preview.delete("1.0", tk.END)
 
         for f in selected:
-            preview, err = process_subtitle_preview(f, shift_sec)
+            transform = transforms[f]
+            if isinstance(transform, str):
+                self.tree.set(f, "status", f"预览失败: {transform}")
+                continue
+            preview, err = process_subtitle_preview(f, transform, limit=10)
             if err:
                 self.tree.set(f, "status", f"预览失败: {err}")
                 continue
             self.tree.set(f, "status", "已预览")
-            self.text_preview.insert(tk.END, f"文件: {f}\n")
+            self.text_preview.insert(tk.END, f"文件: {f}  （{transform}）\n")
             for old, new in preview[:10]:  # 预览前10行时间改动
                 self.text_preview.insert(tk.END, f"  {old}  -->  {new}\n")
             self.text_preview.insert(tk.END, "\n")
 
+    # 自动对齐时每个文件用自己检测到的变换，否则统一用手填的
+    def transforms_for(self, files):
+        if not self.auto_sync_var.get():
+            transform = self.read_transform()
+            return None if transform is None else {f: transform for f in files}
+        if np is None:
+            messagebox.showerror("错误", "自动对齐需要安装 numpy")
+            return None
+        ref_dir = self.entry_reference.get().strip()
+        if not os.path.isdir(ref_dir):
+            messagebox.showerror("错误", "请选择有效的参考字幕文件夹")
+            return None
+        ref_files = scan_subtitles(ref_dir)
+        detect_scale = self.detect_scale_var.get()
+        transforms = {}
+        for f in files:
+            ref = find_reference(f, ref_files)
+            if ref is None:
+                transforms[f] = "找不到参考字幕"
+                continue
+            try:
+                st = os.stat(f)
+                key = auto_sync_key(ref, detect_scale)
+                transform, overlap = detect_transform(load_subtitle(f), load_subtitle(ref), detect_scale)
+                transforms[f] = transform
+                self.detected[f] = (st.st_size, st.st_mtime_ns, key, transform)
+                self.tree.set(f, "status", f"已对齐 {overlap:.0%}")
+            except Exception as e:
+                transforms[f] = str(e)
+        return transforms
+
+    def read_transform(self):
+        try:
+            return TimeTransform.parse(self.entry_shift.get().strip(), self.entry_scale.get(), self.entry_segments.get())
+        except (ValueError, ZeroDivisionError) as e:
+            messagebox.showerror("错误", f"请输入有效的时间偏移、缩放系数和分段设置\n{e}")
+            return None
+
     def batch_process(self):
+        if self.batch_state is not None:
+            return
         selected = self.tree.selection()
         if not selected:
             messagebox.showwarning("提示", "请先选择至少一个字幕文件")
             return
-        shift_str = self.entry_shift.get().strip()
-        if not shift_str:
+        auto_sync = self.auto_sync_var.get()
+        if not auto_sync and not self.entry_shift.get().strip():
             messagebox.showerror("错误", "请输入时间偏移秒数")
             return
-        try:
-            shift_sec = float(shift_str)
-        except:
-            messagebox.showerror("错误", "请输入有效的时间偏移数值")
-            return
 
         output_dir = self.entry_output.get().strip()
         if not output_dir or not os.path.isdir(output_dir):
             messagebox.showerror("错误", "请选择有效的输出文件夹路径")
             return
 
-        success_count = 0
-        fail_count = 0
-        log_entries = []
-
-        for f in selected:
-            preview, err = process_subtitle(f, shift_sec, output_dir)
-            if err:
-                self.tree.set(f, "status", f"处理失败: {err}")
-                fail_count += 1
-                log_entries.append(f"{datetime.now()} 处理失败 {f} 错误: {err}\n")
-            else:
-                self.tree.set(f, "status", "处理成功")
-                success_count += 1
-                log_entries.append(f"{datetime.now()} 处理成功 {f} 偏移 {shift_sec} 秒\n")
+        # 参考字幕配对在主线程做完（只看文件名），对齐和写文件交给进程池
+        tasks = []
+        failed = []
+        manifest = ShiftManifest(output_dir)
+        skip_done = self.skip_done_var.get()
+        if auto_sync:
+            if np is None:
+                messagebox.showerror("错误", "自动对齐需要安装 numpy")
+                return
+            ref_dir = self.entry_reference.get().strip()
+            if not os.path.isdir(ref_dir):
+                messagebox.showerror("错误", "请选择有效的参考字幕文件夹")
+                return
+            ref_files = scan_subtitles(ref_dir)
+            detect_scale = self.detect_scale_var.get()
+            for f in selected:
+                ref = find_reference(f, ref_files)
+                if ref is None:
+                    failed.append((f, "找不到参考字幕", "", None))
+                else:
+                    # 选中后被删掉或移走的文件只算这一个失败，不影响整批
+                    try:
+                        key = auto_sync_key(ref, detect_scale)
+                        st = os.stat(f)
+                    except OSError as e:
+                        failed.append((f, str(e), "", None))
+                        continue
+                    # 预览时已经对齐过、之后字幕和参考都没变的，把结果直接交给进程，不用再算一遍
+                    cached = self.detected.get(f)
+                    transform = cached[3] if cached and cached[:3] == (st.st_size, st.st_mtime_ns, key) else None
+                    tasks.append((f, transform, ref, detect_scale, key))
+        else:
+            transform = self.read_transform()
+            if transform is None:
+                return
+            tasks = [(f, transform, None, False, transform.key()) for f in selected]
+
+        skipped = []
+        if skip_done:
+            remaining = []
+            for task in tasks:
+                (skipped if manifest.is_current(task[0], task[4]) else remaining).append(task)
+            tasks = remaining
+
+        self.cancel_event.clear()
+        self.batch_state = {"total": len(selected), "done": len(skipped), "success": 0, "fail": 0,
+                            "skipped": len(skipped), "log": [], "manifest": manifest}
+        for task in skipped:
+            entry = manifest.lookup(task[0])
+            self.tree.set(task[0], "status", f"已跳过（{entry.get('applied', '')}）")
+        for item in failed:
+            self.result_queue.put(item)
+        self.btn_batch.config(state=tk.DISABLED)
+        self.btn_cancel.config(state=tk.NORMAL)
+        threading.Thread(target=self._run_pool, args=(tasks, output_dir), daemon=True).start()
+        self.root.after(UI_POLL_MS, self._poll_results)
+
+    # 分块提交，同时在跑的块不超过进程数的两倍，取消时不再提交并撤掉排队中的块
+    def _run_pool(self, tasks, output_dir):
+        chunks = [tasks[i:i + BATCH_CHUNK] for i in range(0, len(tasks), BATCH_CHUNK)]
+        try:
+            with ProcessPoolExecutor(max_workers=PROCESS_WORKERS) as pool:
+                pending = set()
+                chunk_of = {}
+                next_chunk = 0
+                while next_chunk < len(chunks) or pending:
+                    while next_chunk < len(chunks) and len(pending) < PROCESS_WORKERS * 2 \
+                            and not self.cancel_event.is_set():
+                        future = pool.submit(process_chunk, chunks[next_chunk], output_dir)
+                        chunk_of[future] = chunks[next_chunk]
+                        pending.add(future)
+                        next_chunk += 1
+                    if not pending:
+                        break
+                    finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        chunk = chunk_of.pop(future)
+                        if future.cancelled():
+                            continue
+                        try:
+                            for item in future.result():
+                                self.result_queue.put(item)
+                        except Exception as e:
+                            # 整块失败（如进程崩溃）时块里每个文件各记一次失败，计数和进度才对得上
+                            for task in chunk:
+                                self.result_queue.put((task[0], str(e), "", None))
+                    if self.cancel_event.is_set():
+                        for future in pending:
+                            future.cancel()
+        finally:
+            self.result_queue.put(None)
+
+    # 主线程定时把结果成批刷到列表上
+    def _poll_results(self):
+        state = self.batch_state
+        finished = False
+        try:
+            for _ in range(2000):
+                item = self.result_queue.get_nowait()
+                if item is None:
+                    finished = True
+                    break
+                path, err, desc, record = item
+                state["done"] += 1
+                if err:
+                    state["fail"] += 1
+                    state["log"].append(f"{datetime.now()} 处理失败 {path} 错误: {err}\n")
+                    if path:
+                        self.tree.set(path, "status", f"处理失败: {err}")
+                else:
+                    state["success"] += 1
+                    state["manifest"].update(path, record)
+                    state["log"].append(f"{datetime.now()} 处理成功 {path} {desc}\n")
+                    self.tree.set(path, "status", "处理成功")
+        except queue.Empty:
+            pass
+        self.label_status.config(text=f"已处理 {state['done']}/{state['total']}")
+        if not finished:
+            self.root.after(UI_POLL_MS, self._poll_results)
+            return
 
         with open(self.log_path, 'a', encoding='utf-8') as logf:
-            logf.writelines(log_entries)
-
-        messagebox.showinfo("完成", f"处理完成！成功: {success_count}，失败: {fail_count}\n日志文件: {self.log_path}")
-
-def process_subtitle_preview(file_path, shift_seconds):
+            logf.writelines(state["log"])
+        try:
+            state["manifest"].save()
+        except OSError as e:
+            messagebox.showwarning("提示", f"保存处理清单失败：{e}")
+        self.batch_state = None
+        self.btn_batch.config(state=tk.NORMAL)
+        self.btn_cancel.config(state=tk.DISABLED)
+        cancelled = "（已取消）" if self.cancel_event.is_set() else ""
+        messagebox.showinfo("完成", f"处理完成{cancelled}！成功: {state['success']}，失败: {state['fail']}，跳过: {state['skipped']}\n日志文件: {self.log_path}")
+
+    def cancel_batch(self):
+        self.cancel_event.set()
+        self.label_status.config(text="正在取消……")
+
+def process_subtitle_preview(file_path, transform, limit=None):
     fmt = os.path.splitext(file_path)[-1].lower().lstrip('.')
-    if fmt not in ['srt', 'vtt']:
+    if fmt not in SUPPORTED_FORMATS:
         return None, "不支持的字幕格式"
 
-    encoding = detect_encoding(file_path)
-
-    with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-        lines = f.readlines()
-
-    shift_ms = int(shift_seconds * 1000)
-    preview_changes = []
-
-    for line in lines:
-        if '-->' in line:
-            try:
-                old_line = line.strip()
-                new_line = shift_timestamp_line(line, shift_ms, fmt).strip()
-                preview_changes.append((old_line, new_line))
-            except Exception as e:
-                continue
-
-    return preview_changes, None
+    if not isinstance(transform, TimeTransform):
+        transform = TimeTransform.shift(transform)
+    doc = load_subtitle(file_path)
+    start, end = doc.transformed(transform)
+    return doc.preview(start, end, limit), None
 
 if __name__ == '__main__':
     root = tk.Tk()
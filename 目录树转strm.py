@@ -1,3 +1,4 @@
+import io
 import os
 import re
 import json
@@ -6,10 +7,14 @@ import traceback
 import time
 import threading
 import shutil
+import hashlib
+import asyncio
+import urllib.request
 import tkinter as tk
 from tkinter import filedialog, scrolledtext, messagebox
 from tkinterdnd2 import TkinterDnD, DND_FILES
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from 编码检测 import detect_encoding
 
 # 基础设置
 try:
@@ -18,10 +23,14 @@ except NameError:
     script_dir = os.getcwd()
 
 CONFIG_FILE = os.path.join(script_dir, 'config.json')
+OPENLIST_CACHE_FILE = os.path.join(script_dir, 'openlist_cache.json')
 
 # 视频格式过滤
 VIDEO_EXTS = ['.mp4', '.mkv', '.avi', '.mov', '.flv', '.ts', '.rmvb', '.iso', '.wmv']
 
+# 检测出的编码解码失败时，依次再严格试这几种，都不行才报错
+TREE_FALLBACK_ENCODINGS = ['utf-8', 'gb18030', 'utf-16']
+
 # 预编译正则
 TREE_LINE_PATTERN = re.compile(r'^([| ]+)[|\\/\-]+(.*)')
 
@@ -47,6 +56,234 @@ def trim_path_by_keyword(path, keyword):
     else:
         return '/' + p.lstrip('/')
 
+def split_openlist_prefix(prefix):
+    """
+    把 STRM 链接前缀拆成 (接口地址, 网盘内根路径)。
+    例如 http://host:5244/d/115/影视 -> ('http://host:5244', '/115/影视')
+    """
+    parsed = urllib.parse.urlparse(prefix.strip())
+    if not parsed.scheme or not parsed.netloc:
+        raise ValueError(f"无效的 openlist 链接前缀: {prefix}")
+    base = f"{parsed.scheme}://{parsed.netloc}"
+    path = urllib.parse.unquote(parsed.path).rstrip('/')
+    # 去掉下载路由 /d 或 /p
+    for route in ('/d', '/p'):
+        if path == route or path.startswith(route + '/'):
+            path = path[len(route):]
+            break
+    return base, path or '/'
+
+
+class OpenlistCrawler:
+    """
+    通过 openlist 的 /api/fs/list 接口并发遍历目录，代替手动导出目录树。
+    目录的修改时间只随它的直接子项变化，所以只在上级目录刚列出、修改时间
+    是最新的情况下，才拿它和缓存比对、沿用缓存的列表；沿用了缓存的目录，
+    它的子目录修改时间也来自缓存，不能再拿来比对，必须重新列出。
+    """
+    def __init__(self, base_url, root_path='/', token='', password='',
+                 max_concurrency=8, per_page=500, timeout=30, cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.root_path = '/' + root_path.strip('/')
+        self.token = token
+        self.password = password
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_page = per_page
+        self.timeout = timeout
+        # 缓存格式: {目录路径: {'modified': 修改时间, 'entries': [[名称, 是否目录, 修改时间], ...]}}
+        self.cache = cache if cache is not None else {}
+        self.listed = 0
+        self.skipped = 0
+
+    def _request_page(self, path, page):
+        body = json.dumps({
+            'path': path,
+            'password': self.password,
+            'page': page,
+            'per_page': self.per_page,
+            'refresh': False,
+        }).encode('utf-8')
+        req = urllib.request.Request(self.base_url + '/api/fs/list', data=body, method='POST')
+        req.add_header('Content-Type', 'application/json')
+        if self.token:
+            req.add_header('Authorization', self.token)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            result = json.loads(resp.read().decode('utf-8'))
+        if result.get('code') != 200:
+            raise RuntimeError(f"列出 {path} 失败: {result.get('message')}")
+        return result.get('data') or {}
+
+    async def _list_dir(self, loop, sem, path):
+        entries = []
+        page = 1
+        while True:
+            async with sem:
+                data = await loop.run_in_executor(None, self._request_page, path, page)
+            content = data.get('content') or []
+            for item in content:
+                entries.append([item.get('name', ''), bool(item.get('is_dir')), item.get('modified')])
+            total = data.get('total') or 0
+            if not content or len(entries) >= total:
+                return entries
+            page += 1
+
+    # fresh 表示 modified 来自刚列出的上级目录，只有这时才能和缓存比对
+    async def _walk(self, loop, sem, path, modified, fresh, visited, paths):
+        visited[path] = True
+        cached = self.cache.get(path)
+        reused = fresh and cached is not None and modified and cached.get('modified') == modified
+        if reused:
+            entries = cached['entries']
+            self.skipped += 1
+        else:
+            entries = await self._list_dir(loop, sem, path)
+            self.cache[path] = {'modified': modified, 'entries': entries}
+            self.listed += 1
+
+        subtasks = []
+        for name, is_dir, child_modified in entries:
+            child = path.rstrip('/') + '/' + name
+            if is_dir:
+                subtasks.append(self._walk(loop, sem, child, child_modified, not reused, visited, paths))
+            elif os.path.splitext(name)[1].lower() in VIDEO_EXTS:
+                paths.append(child[len(self.root_path):].lstrip('/'))
+        if subtasks:
+            await asyncio.gather(*subtasks)
+
+    async def _crawl(self):
+        loop = asyncio.get_event_loop()
+        sem = asyncio.Semaphore(self.max_concurrency)
+        visited, paths = {}, []
+        # 根目录没有上级可比对修改时间，每次都重新列出
+        await self._walk(loop, sem, self.root_path, None, False, visited, paths)
+        # 已删除的目录从缓存中清掉
+        for stale in [p for p in self.cache if p not in visited]:
+            del self.cache[stale]
+        return paths
+
+    def crawl(self):
+        """遍历整棵目录树，返回相对根路径的媒体文件列表。"""
+        self.listed = 0
+        self.skipped = 0
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        loop.set_default_executor(executor)
+        try:
+            paths = loop.run_until_complete(self._crawl())
+        finally:
+            loop.close()
+            executor.shutdown(wait=False)
+        paths.sort()
+        return paths
+
+class ShardedStrmIndex:
+    """
+    按顶层文件夹分片的 STRM 索引，放在输出目录的 .strm_index/ 下：
+    manifest.json 记录 顶层文件夹 -> 分片文件，每个分片各自一个 json。
+    选择目录/增量模式只读写涉及到的分片，备份也按分片做。
+    """
+    DIR_NAME = '.strm_index'
+    MANIFEST = 'manifest.json'
+    LEGACY_FILE = '.strm_index.json'
+
+    def __init__(self, output_dir, log=None):
+        self.output_dir = output_dir
+        self.index_dir = os.path.join(output_dir, self.DIR_NAME)
+        self.manifest_path = os.path.join(self.index_dir, self.MANIFEST)
+        self.log = log or (lambda text: None)
+        self.manifest = {}
+
+    @staticmethod
+    def shard_key(path):
+        """索引键 (/顶层/.../文件) 所属的分片，根目录下的文件归到空字符串。"""
+        parts = path.replace('\\', '/').lstrip('/').split('/', 1)
+        return parts[0] if len(parts) > 1 else ''
+
+    @staticmethod
+    def _shard_file(key):
+        return hashlib.md5(key.encode('utf-8')).hexdigest()[:16] + '.json'
+
+    def _write_json(self, path, data):
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def open(self):
+        """载入清单；旧版单文件索引第一次打开时自动拆分。"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f).get('shards', {})
+            return self
+
+        self.manifest = {}
+        legacy = os.path.join(self.output_dir, self.LEGACY_FILE)
+        if os.path.exists(legacy):
+            with open(legacy, 'r', encoding='utf-8') as f:
+                old = json.load(f)
+            self.save(self.group(old), backup=False)
+            os.replace(legacy, legacy + '.migrated')
+            self.log(f"[索引] 已将旧索引 ({len(old)} 项) 拆分为 {len(self.manifest)} 个分片。")
+        else:
+            self._write_manifest()
+        return self
+
+    def _write_manifest(self):
+        self._write_json(self.manifest_path, {'version': 1, 'shards': self.manifest})
+
+    def group(self, entries):
+        shards = {}
+        for k, v in entries.items():
+            shards.setdefault(self.shard_key(k), {})[k] = v
+        return shards
+
+    def keys(self):
+        return list(self.manifest.keys())
+
+    def load_shard(self, key):
+        info = self.manifest.get(key)
+        if not info:
+            return {}
+        path = os.path.join(self.index_dir, info['file'])
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self, keys=None):
+        """合并读取指定分片，keys 为 None 时读取全部。"""
+        merged = {}
+        for key in (self.keys() if keys is None else keys):
+            merged.update(self.load_shard(key))
+        return merged
+
+    def _backup_shard(self, key):
+        info = self.manifest.get(key)
+        if not info:
+            return
+        path = os.path.join(self.index_dir, info['file'])
+        if os.path.exists(path):
+            shutil.copy2(path, path + '.bak')
+
+    def save(self, shards, backup=True):
+        """只写入传入的分片 {分片键: 索引}，空分片连同它的备份一起删除。"""
+        for key, data in shards.items():
+            fname = self._shard_file(key)
+            path = os.path.join(self.index_dir, fname)
+            if data:
+                if backup:
+                    self._backup_shard(key)
+                self._write_json(path, data)
+                self.manifest[key] = {'file': fname, 'count': len(data)}
+            else:
+                for stale in (path, path + '.bak'):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+                self.manifest.pop(key, None)
+        self._write_manifest()
+
+
 class StrmGeneratorApp:
     def __init__(self, root):
         self.root = root
@@ -57,6 +294,8 @@ class StrmGeneratorApp:
         self.folder_choices = set()
         self.selected_folders = set()
         self.last_mode = None 
+        # 媒体列表来源: 'tree' 目录树文件 / 'openlist' 接口直读
+        self.source = 'tree'
         
         self._is_loading = threading.Lock()
         
@@ -103,6 +342,13 @@ class StrmGeneratorApp:
         self.save_var = tk.BooleanVar(value=True)
         tk.Checkbutton(frame, text="保存设置", variable=self.save_var).grid(row=4, column=2, sticky='w')
 
+        tk.Label(frame, text="⑥ openlist 令牌 (接口载入用)：").grid(row=5, column=0, sticky='w', pady=5)
+        self.token_var = tk.StringVar()
+        tk.Entry(frame, textvariable=self.token_var, width=50, show='*').grid(row=5, column=1, sticky='w', padx=5)
+        tk.Label(frame, text="并发数：").grid(row=5, column=1, sticky='e', padx=(0, 60))
+        self.concurrency_var = tk.IntVar(value=8)
+        tk.Spinbox(frame, from_=1, to=64, textvariable=self.concurrency_var, width=5).grid(row=5, column=1, sticky='e', padx=(0, 10))
+
         frame.grid_columnconfigure(1, weight=1)
 
         # 2. 按钮区
@@ -110,6 +356,7 @@ class StrmGeneratorApp:
         btn_frame.pack(side='top', pady=6, fill='x', padx=10)
 
         tk.Button(btn_frame, text="📂 载入目录树 (第一步)", width=20, command=self.load_tree_only).pack(side='left', padx=6, expand=True)
+        tk.Button(btn_frame, text="🌐 从 openlist 载入", width=20, command=self.load_from_openlist).pack(side='left', padx=6, expand=True)
         tk.Button(btn_frame, text="🔥 全量生成", width=20, fg='red', command=self.confirm_and_start_full_generation).pack(side='left', padx=6, expand=True)
         tk.Button(btn_frame, text="🔄 增量生成", width=20, command=lambda: self.start_generation(mode='increment')).pack(side='left', padx=6, expand=True)
         tk.Button(btn_frame, text="✅ 选择目录生成", width=20, command=self.show_folder_selector).pack(side='left', padx=6, expand=True)
@@ -223,6 +470,8 @@ class StrmGeneratorApp:
                 self.start_keyword_var.set(config.get('start_keyword', ''))
                 self.save_var.set(config.get('save_config', True))
                 self.auto_load_latest_var.set(config.get('auto_load_latest', True))
+                self.token_var.set(config.get('openlist_token', ''))
+                self.concurrency_var.set(config.get('openlist_concurrency', 8))
                 self.log(f"[配置] 成功加载配置文件: {CONFIG_FILE}")
             except Exception as e:
                 self.log(f"[错误] 配置文件 {CONFIG_FILE} 读取失败: {e}")
@@ -239,7 +488,9 @@ class StrmGeneratorApp:
                 'start_keyword': self.start_keyword_var.get(),
                 'last_mode': mode or self.last_mode,
                 'save_config': self.save_var.get(),
-                'auto_load_latest': self.auto_load_latest_var.get()
+                'auto_load_latest': self.auto_load_latest_var.get(),
+                'openlist_token': self.token_var.get(),
+                'openlist_concurrency': self.concurrency_var.get()
             }
             try:
                 with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
@@ -252,22 +503,15 @@ class StrmGeneratorApp:
             except Exception:
                 pass
 
-    def _backup_index_file(self, index_file_path):
-        if not os.path.exists(index_file_path): return
-        try:
-            backup_path = os.path.join(script_dir, os.path.basename(index_file_path) + ".bak")
-            shutil.copy2(index_file_path, backup_path)
-            self.log(f"[索引] 已备份当前索引文件到: {backup_path}")
-        except Exception as e:
-            self.log(f"[错误] 备份索引文件失败: {e}")
-
     # 解析部分
     def read_text_file_with_fallback(self, path):
-        for enc in ['utf-8', 'utf-16', 'utf-8-sig', 'gb18030', 'gbk']:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        for enc in dict.fromkeys([detect_encoding(path, raw)] + TREE_FALLBACK_ENCODINGS):
             try:
-                with open(path, 'r', encoding=enc) as f:
-                    return f.readlines()
-            except UnicodeDecodeError:
+                # 和文本模式打开一样统一换行符
+                return io.StringIO(raw.decode(enc), newline=None).readlines()
+            except (UnicodeDecodeError, LookupError):
                 continue
         raise UnicodeDecodeError("read", b"", 0, 1, "文件编码错误，建议另存为 UTF-8")
 
@@ -334,6 +578,12 @@ class StrmGeneratorApp:
                         paths.append(name)
         return paths
 
+    def _build_folder_set(self, all_media_paths):
+        folder_set = sorted(set(os.path.dirname(p) for p in all_media_paths if os.path.dirname(p)))
+        if any(not os.path.dirname(p) for p in all_media_paths):
+            folder_set.insert(0, "")
+        return folder_set
+
     # 载入线程
     def _load_tree_blocking(self):
         input_path = self.path_var.get()
@@ -345,12 +595,7 @@ class StrmGeneratorApp:
         try:
             lines = self.read_text_file_with_fallback(input_path) 
             all_media_paths = self.parse_directory_tree(lines)
-            
-            folder_set = sorted(set(os.path.dirname(p) for p in all_media_paths if os.path.dirname(p)))
-            if any(not os.path.dirname(p) for p in all_media_paths):
-                 folder_set.insert(0, "") 
-                 
-            return (all_media_paths, folder_set)
+            return (all_media_paths, self._build_folder_set(all_media_paths))
         except Exception as e:
             self.log(f"[错误] 解析目录树失败: {e}")
             self.log(traceback.format_exc())
@@ -388,6 +633,7 @@ class StrmGeneratorApp:
                     self.all_media_paths = all_media_paths
                     self.folder_choices = set(folder_set)
                     self.selected_folders = set() 
+                    self.source = 'tree'
                     
                     self.log(f"[载入] 成功解析 {len(self.all_media_paths)} 个媒体文件，{len(folder_set)} 个文件夹。")
                     self.status_var.set(f"✅ 目录树载入完成，共 {len(self.all_media_paths)} 个文件。")
@@ -396,9 +642,12 @@ class StrmGeneratorApp:
                 self.root.after(0, update_ui)
 
             except Exception as e:
+                # e 在 except 结束时就被删除，traceback 也只在 except 里有效，先取出来再交给主线程
+                msg = str(e)
+                tb = traceback.format_exc()
                 def log_err():
-                    self.log(f"[错误] 载入目录树时发生意外: {e}")
-                    self.log(traceback.format_exc())
+                    self.log(f"[错误] 载入目录树时发生意外: {msg}")
+                    self.log(tb)
                     self.status_var.set("❌ 载入失败！请检查日志。")
                     if callback: callback(False)
                 self.root.after(0, log_err)
@@ -408,6 +657,82 @@ class StrmGeneratorApp:
         t = threading.Thread(target=worker, daemon=True)
         t.start()
 
+    # openlist 接口载入
+    def _load_openlist_cache(self, base, root_path):
+        if not os.path.exists(OPENLIST_CACHE_FILE):
+            return {}
+        try:
+            with open(OPENLIST_CACHE_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # 换了服务器或根路径，旧缓存作废
+            if data.get('base') == base and data.get('root') == root_path:
+                return data.get('dirs', {})
+        except Exception as e:
+            self.log(f"[警告] openlist 缓存读取失败 ({e})，将重新遍历。")
+        return {}
+
+    def _save_openlist_cache(self, base, root_path, dirs):
+        try:
+            with open(OPENLIST_CACHE_FILE, 'w', encoding='utf-8') as f:
+                json.dump({'base': base, 'root': root_path, 'dirs': dirs}, f, ensure_ascii=False)
+        except Exception as e:
+            self.log(f"[错误] 保存 openlist 缓存失败: {e}")
+
+    def load_from_openlist(self, callback=None):
+        if not self._is_loading.acquire(blocking=False):
+            self.log("[提示] 正在处理中，请稍候...")
+            if callback: self.root.after(0, lambda: callback(False))
+            return
+
+        prefix = self.prefix_var.get().strip()
+        token = self.token_var.get().strip()
+        try:
+            concurrency = int(self.concurrency_var.get())
+        except (tk.TclError, ValueError):
+            concurrency = 8
+        self.save_config()
+        self.root.after(0, lambda: self.status_var.set("🔄 正在从 openlist 遍历目录..."))
+
+        def worker():
+            try:
+                base, root_path = split_openlist_prefix(prefix)
+                self.log(f"[openlist] 开始遍历 {base} {root_path} (并发 {concurrency})...")
+                start = time.time()
+                crawler = OpenlistCrawler(base, root_path, token=token, max_concurrency=concurrency,
+                                          cache=self._load_openlist_cache(base, root_path))
+                all_media_paths = crawler.crawl()
+                self._save_openlist_cache(base, root_path, crawler.cache)
+                folder_set = self._build_folder_set(all_media_paths)
+                cost = time.time() - start
+
+                def update_ui():
+                    self.all_media_paths = all_media_paths
+                    self.folder_choices = set(folder_set)
+                    self.selected_folders = set()
+                    self.source = 'openlist'
+
+                    self.log(f"[openlist] 重新列出 {crawler.listed} 个目录，沿用缓存 {crawler.skipped} 个目录，耗时 {cost:.1f} 秒。")
+                    self.log(f"[载入] 成功获取 {len(all_media_paths)} 个媒体文件，{len(folder_set)} 个文件夹。")
+                    self.status_var.set(f"✅ openlist 载入完成，共 {len(all_media_paths)} 个文件。")
+                    if callback: callback(True)
+
+                self.root.after(0, update_ui)
+
+            except Exception as e:
+                msg = str(e)
+                tb = traceback.format_exc()
+                def log_err():
+                    self.log(f"[错误] 从 openlist 载入失败: {msg}")
+                    self.log(tb)
+                    self.status_var.set("❌ openlist 载入失败！请检查前缀和令牌。")
+                    if callback: callback(False)
+                self.root.after(0, log_err)
+            finally:
+                self._is_loading.release()
+
+        t = threading.Thread(target=worker, daemon=True)
+        t.start()
+
     # 目录多选窗
     def show_folder_selector(self):
         if not self.folder_choices:
@@ -522,8 +847,11 @@ class StrmGeneratorApp:
             ext = self.ext_var.get()
             start_keyword = self.start_keyword_var.get().strip()
             encode_url = self.encode_var.get()
+            # 接口载入的路径已经相对于前缀，不再按关键词截取
+            if self.source == 'openlist':
+                start_keyword = ''
             
-            if not input_path or not os.path.exists(input_path):
+            if self.source == 'tree' and (not input_path or not os.path.exists(input_path)):
                 self.log("[错误] 目录树文件路径无效！")
                 self.root.after(0, lambda: self.status_var.set("❌ 目录树文件路径无效！"))
                 return
@@ -568,17 +896,22 @@ class StrmGeneratorApp:
             self.log(f"[过滤] 共有 {len(media_paths)} 个文件待处理...")
 
             files_to_gen = [] 
-            index_file = os.path.join(output_dir, '.strm_index.json')
+            index = ShardedStrmIndex(output_dir, log=self.log)
+            try:
+                index.open()
+            except Exception as e:
+                self.log(f"[警告] 打开索引失败 ({e})，将使用空索引。")
+                index.manifest = {}
             old_index = {}
             new_index = {} 
+            removed = []
 
             if mode == "increment":
-                if os.path.exists(index_file):
-                    try:
-                        with open(index_file, 'r', encoding='utf-8') as f: old_index = json.load(f)
-                        self.log(f"[索引] 成功载入旧索引，共 {len(old_index)} 项。")
-                    except Exception as e:
-                        self.log(f"[警告] 载入旧索引失败 ({e})，将视为全量操作。")
+                try:
+                    old_index = index.load()
+                    self.log(f"[索引] 成功载入旧索引，共 {len(old_index)} 项 ({len(index.keys())} 个分片)。")
+                except Exception as e:
+                    self.log(f"[警告] 载入旧索引失败 ({e})，将视为全量操作。")
                 
                 for path in media_paths:
                     fp = trim_path_by_keyword(path, start_keyword)
@@ -657,34 +990,41 @@ class StrmGeneratorApp:
 
             if mode == "full":
                 try:
-                    self._backup_index_file(index_file)
-                    with open(index_file, 'w', encoding='utf-8') as f:
-                        json.dump(success_idx, f, ensure_ascii=False, indent=2)
-                    self.log(f"[索引] 全量模式：已为 {len(success_idx)} 个【成功写入】的文件保存索引。")
+                    shards = index.group(success_idx)
+                    # 这次没有出现的旧分片一并清空
+                    for key in index.keys():
+                        shards.setdefault(key, {})
+                    index.save(shards)
+                    self.log(f"[索引] 全量模式：已为 {len(success_idx)} 个【成功写入】的文件保存索引 ({len(index.keys())} 个分片)。")
                 except Exception as e:
                     self.log(f"[错误] 保存 'full' 模式索引失败: {e}")
 
             elif mode in ["single", "increment"]:
                 if success_idx or (mode == "increment" and removed):
-                    curr = {}
-                    if os.path.exists(index_file):
-                        try:
-                            with open(index_file, 'r', encoding='utf-8') as f: curr = json.load(f)
-                        except: pass
-                    
-                    final = curr.copy()
+                    # 只读写本次涉及的分片
+                    touched = set(index.shard_key(k) for k in success_idx)
+                    if mode == "increment":
+                        touched.update(index.shard_key(r) for r in removed)
+                    try:
+                        curr = {key: index.load_shard(key) for key in touched}
+                    except Exception:
+                        curr = {key: {} for key in touched}
+
+                    final = {key: data.copy() for key, data in curr.items()}
                     if mode == "increment":
                         for r in removed: 
-                            if r in final: 
-                                del final[r]
+                            shard = final[index.shard_key(r)]
+                            if r in shard: 
+                                del shard[r]
                                 self.log(f"[清理] 已从索引中移除: {r}")
-                    final.update(success_idx)
+                    for k, v in success_idx.items():
+                        final[index.shard_key(k)][k] = v
+                    changed = {key: data for key, data in final.items() if data != curr[key]}
                     
-                    if final != curr:
+                    if changed:
                         try:
-                            self._backup_index_file(index_file)
-                            with open(index_file, 'w', encoding='utf-8') as f:
-                                json.dump(final, f, ensure_ascii=False, indent=2)
+                            index.save(changed)
+                            self.log(f"[索引] 已更新 {len(changed)} 个分片，备份保存在各分片旁的 .bak 文件。")
                             
                             if mode == "increment":
                                 self.log(f"[索引] 增量模式：已【更新】全局索引 (新增 {len(success_idx)} 项，移除 {len(removed)} 项)。")
@@ -0,0 +1,76 @@
+import os
+import codecs
+import threading
+from collections import OrderedDict
+
+# 几个脚本共用的文本编码检测：先看 BOM，再严格按 UTF-8 解码，都不行才动用 chardet
+# chardet 是纯 Python 实现，很慢，只在确实需要时才导入
+
+CHARDET_SAMPLE = 10000     # 交给 chardet 的字节数
+CACHE_SIZE = 4096
+DETECT_LIMIT = 4 * 1024 * 1024   # 调用方没给内容时最多读这么多来判断，大文件不整读
+
+# UTF-32 的 BOM 以 UTF-16 的 BOM 开头，必须先判断
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# chardet 报 GB2312 时实际文件常夹带 GBK 字符，统一放宽到超集
+WIDER_ENCODINGS = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'ascii': 'utf-8'}
+
+_chardet = None
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _chardet_detect(raw):
+    global _chardet
+    if _chardet is None:
+        try:
+            import chardet
+            _chardet = chardet
+        except ImportError:
+            _chardet = False
+    if not _chardet:
+        # 没装 chardet 时，非 UTF-8 的中文文件绝大多数是 GBK 系
+        return 'gb18030'
+    result = _chardet.detect(raw[:CHARDET_SAMPLE])
+    encoding = (result['encoding'] or 'utf-8').lower()
+    return WIDER_ENCODINGS.get(encoding, encoding)
+
+# 根据已读取的内容判断编码；truncated 表示 raw 只是文件开头一段，末尾可能截断了多字节字符
+def detect_encoding_from_bytes(raw, truncated=False):
+    for bom, encoding in BOMS:
+        if raw.startswith(bom):
+            return encoding
+    try:
+        raw.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        if truncated and e.start >= len(raw) - 3 and e.reason == 'unexpected end of data':
+            return 'utf-8'
+    return _chardet_detect(raw)
+
+# 检测文件编码，按 (路径, 大小, 修改时间) 缓存；调用方已经读过整个文件时把内容传进来，省一次读盘
+def detect_encoding(file_path, raw=None):
+    st = os.stat(file_path)
+    key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+    with _cache_lock:
+        encoding = _cache.get(key)
+        if encoding is not None:
+            _cache.move_to_end(key)
+            return encoding
+    truncated = False
+    if raw is None:
+        with open(file_path, 'rb') as f:
+            raw = f.read(DETECT_LIMIT)
+        truncated = st.st_size > len(raw)
+    encoding = detect_encoding_from_bytes(raw, truncated)
+    with _cache_lock:
+        _cache[key] = encoding
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return encoding
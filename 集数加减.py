@@ -3,63 +3,508 @@ import re
 import shutil
 import threading
 import json
+import time
+import errno
+import queue
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import uuid
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 from tkinter.ttk import Progressbar
 
 CONFIG_FILE = "config.json"
-LOG_FILE = "operation_log.json"
+LOG_FILE = "operation_log.json"       # 旧版整体覆盖写的记录，启动时导入日志后改名
+JOURNAL_FILE = "operation_journal.jsonl"
+JOURNAL_FSYNC_EVERY = 64                # 攒够这么多条或超过 1 秒才 fsync 一次
+UNDO_WORKERS = min(16, (os.cpu_count() or 2) * 2)
+UI_POLL_MS = 100
+
+COPY_WORKERS = min(8, (os.cpu_count() or 2) * 2)
+DEVICE_SLOTS = 2                        # 每块盘同时读写的文件数，多了机械盘会来回寻道
+COPY_CHUNK = 8 * 1024 * 1024
+CHECKPOINT_BYTES = 256 * 1024 * 1024    # 每拷这么多落盘一次并记下断点
+PART_SUFFIX = ".part"
+CHECKPOINT_SUFFIX = ".part.json"
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
 
 def find_episodes(root_dir, exts=None):
     if exts is None:
         exts = ['.mp4', '.mkv', '.avi', '.mov', '.wmv']
-    exts = [e.lower() for e in exts]
+    exts = tuple(e.lower() for e in exts)
     matches = []
     for dirpath, _, filenames in os.walk(root_dir):
         for f in filenames:
-            if any(f.lower().endswith(ext) for ext in exts):
+            if f.lower().endswith(exts):
                 matches.append(os.path.join(dirpath, f))
     return matches
 
+# 一个合并的正则覆盖所有集数写法，每种写法一个命名分组，按优先级挑最可信的匹配
+# 集数后面不能紧跟数字或单独的 p/i，否则 E1080p、E720i 这类分辨率会被当成集数；
+# *_more 分组收下多集写法里后面的所有集数，解析时再逐个取出
+EPISODE_PATTERN = re.compile(r"""
+    (?=[SsEe第\[\s])  # 先按首字符过滤，绝大多数位置不用逐个尝试分支
+    (?:
+        (?P<sxe>[Ss](?P<sxe_s>\d{1,2})[Ee](?P<sxe_e>\d{1,4})(?!\d|[pPiI](?![A-Za-z]))
+            (?P<sxe_more>(?:[-._\ ]?[Ee]\d{1,4}(?!\d|[pPiI](?![A-Za-z])))*))                # S01E05 / S01E05-E06 / S01E05E06 / S01E05.E06
+      | (?P<cn>第(?P<cn_e>\d+)[集话話回])                                                   # 第5集 / 第05话 / 第5回
+      | (?P<ep>(?:(?<![A-Za-z])[Ee][Pp]?|E[Pp])(?P<ep_e>\d{1,4})(?!\d|[pPiI](?![A-Za-z]))
+            (?P<ep_more>(?:(?:-[Ee]?[Pp]?|[._\ ]?[Ee][Pp]?)\d{1,4}(?!\d|[pPiI](?![A-Za-z])))*))  # E05 / Ep05 / TitleEP05 / E01-E02 / E01.E02
+      | (?P<bracket>\[(?P<br_e>\d{1,3})(?:[vV]\d)?\])                                       # [05] / [05v2] 动漫字幕组
+      | (?P<dash>\s-\s(?P<dash_e>\d{1,3})(?:[vV]\d)?(?=[\s.\[(]|$))                           # 标题 - 05 [1080p]
+    )
+""", re.VERBOSE)
+
+# 多集写法的结束集最多比开始集大这么多，再大多半是分辨率之类被误当成了集数
+MAX_EPISODE_RANGE = 50
+EPISODE_DIGITS = re.compile(r"\d+")
+
+# 各写法的优先级和对应的 (季, 集, 后续集数) 分组名
+EPISODE_KINDS = {
+    "sxe": (5, "sxe_s", "sxe_e", "sxe_more"),
+    "cn": (4, None, "cn_e", None),
+    "ep": (3, None, "ep_e", "ep_more"),
+    "bracket": (2, None, "br_e", None),
+    "dash": (1, None, "dash_e", None),
+}
+
+# 解析结果：kind 写法、season 季(没有时为 0)、episode 集、episode_end 多集写法的最后一集(没有时为 None)、
+# spans 为每个集数字在文件名中的位置 [(开始, 结束), ...]，改名时直接按位置替换
+EpisodeMatch = namedtuple("EpisodeMatch", "kind season episode episode_end spans")
+
+class EpisodeParser:
+    def __init__(self, pattern=EPISODE_PATTERN, kinds=EPISODE_KINDS):
+        self.pattern = pattern
+        self.kinds = kinds
+
+    def parse(self, filename):
+        best = None
+        best_priority = 0
+        for m in self.pattern.finditer(filename):
+            kind = m.lastgroup
+            priority, s_group, e_group, more_group = self.kinds[kind]
+            if priority <= best_priority:
+                continue
+            spans = [m.span(e_group)]
+            episode_end = None
+            episode = int(m.group(e_group))
+            if more_group and m.group(more_group):
+                # 后面的集数要依次增大且不能大得离谱，遇到不合理的就到此为止，前面的照常算多集
+                offset = m.start(more_group)
+                last = episode
+                for d in EPISODE_DIGITS.finditer(m.group(more_group)):
+                    number = int(d.group())
+                    if not last < number <= episode + MAX_EPISODE_RANGE:
+                        break
+                    spans.append((offset + d.start(), offset + d.end()))
+                    episode_end = last = number
+            season = int(m.group(s_group)) if s_group else 0
+            best = EpisodeMatch(kind, season, episode, episode_end, spans)
+            best_priority = priority
+        return best
+
+    def parse_many(self, filenames):
+        parse = self.parse
+        return [parse(name) for name in filenames]
+
+    # 批量解析整个目录：返回 [(完整路径, EpisodeMatch 或 None)]
+    def parse_dir(self, root_dir, exts=None):
+        files = find_episodes(root_dir, exts)
+        return list(zip(files, self.parse_many([os.path.basename(f) for f in files])))
+
+    # 按解析时记录的位置替换集数，多集写法的每一集同步加减，保留原有的补零宽度
+    @staticmethod
+    def replace(filename, match, new_episode):
+        delta = new_episode - match.episode
+        result = filename
+        for start, end in sorted(match.spans, reverse=True):
+            number = int(filename[start:end]) + delta
+            result = result[:start] + str(number).zfill(end - start) + result[end:]
+        return result
+
+EPISODE_PARSER = EpisodeParser()
+
 def parse_episode_number(filename):
     """
     支持多种格式：
-    - S01E05 或 s01e05
-    - E05 或 Ep05
+    - S01E05 或 s01e05，S01E05-E06 / S01E05.E06
+    - E05 或 Ep05，E01-E02
     - 第5集 / 第05集 / 第5话 / 第05话 / 第5回 等
+    - [05] / 标题 - 05 这类动漫编号
+    返回 (季, 集)，没有季时季为 0
     """
-    patterns = [
-        re.compile(r'[Ss](\d+)[Ee](\d+)'),       # S01E05
-        re.compile(r'[Ee][Pp]?(\d+)'),          # E05, Ep05
-        re.compile(r'第0*(\d+)[集话回]'),         # 第5集，第05话，第5回
-    ]
-    for p in patterns:
-        m = p.search(filename)
-        if m:
-            if len(m.groups()) == 2:
-                season = int(m.group(1))
-                episode = int(m.group(2))
-                return season, episode
-            elif len(m.groups()) == 1:
-                return 0, int(m.group(1))
+    m = EPISODE_PARSER.parse(filename)
+    if m:
+        return m.season, m.episode
     return None
 
+# 保留旧接口；季号保持文件名中的原样，season 参数不再使用
 def replace_episode_number(filename, season, episode):
-    sxe_pattern = re.compile(r'[Ss](\d+)[Ee](\d+)')
-    if sxe_pattern.search(filename):
-        return sxe_pattern.sub(f"S{season:02d}E{episode:02d}", filename)
-
-    e_pattern = re.compile(r'[Ee][Pp]?(\d+)')
-    if e_pattern.search(filename):
-        return e_pattern.sub(f"E{episode:02d}", filename)
-
-    cn_pattern = re.compile(r'第0*\d+[集话回]')
-    if cn_pattern.search(filename):
-        # 替换成“第X集”，固定格式，方便识别
-        return cn_pattern.sub(f"第{episode}集", filename)
+    m = EPISODE_PARSER.parse(filename)
+    if not m:
+        # 找不到匹配就返回原文件名
+        return filename
+    return EPISODE_PARSER.replace(filename, m, episode)
+
+# 原地改名：先算出全部 (源, 目标)，同名目标或占用了非本批文件的目标直接跳过
+def plan_renames(parsed_files, delta):
+    pairs = {}
+    skipped = []
+    taken = {}
+    for f, parsed in parsed_files:
+        if not parsed:
+            skipped.append((f, "未识别集数"))
+            continue
+        new_episode = parsed.episode + delta
+        if new_episode < 1:
+            skipped.append((f, "调整后集数小于1"))
+            continue
+        dst = os.path.join(os.path.dirname(f), EPISODE_PARSER.replace(os.path.basename(f), parsed, new_episode))
+        if dst == f:
+            continue
+        if dst in taken:
+            skipped.append((f, f"与 {taken[dst]} 改名后重名"))
+            continue
+        taken[dst] = f
+        pairs[f] = dst
+    # 目标已存在且不是本批要挪走的文件，会被覆盖，整条链都不能动
+    blocked = {src for src, dst in pairs.items() if dst not in pairs and os.path.lexists(dst)}
+    while blocked:
+        for src in blocked:
+            skipped.append((src, f"目标已存在: {pairs.pop(src)}"))
+        blocked = {src for src, dst in pairs.items() if dst in blocked}
+    return pairs, skipped
+
+# 把改名计划排成安全的执行顺序：链从尾部开始挪，环先把一个文件挪到临时名再收尾
+def order_renames(pairs, tag):
+    pending = dict(pairs)
+    steps = []
+    while pending:
+        start = next(iter(pending))
+        chain = [start]
+        cur = pending[start]
+        # 每个目标只对应一个源，所以沿着链走要么落到空位，要么绕回起点
+        while cur in pending and cur != start:
+            chain.append(cur)
+            cur = pending[cur]
+        if cur == start:
+            tmp = os.path.join(os.path.dirname(start), f".{os.path.basename(start)}.{tag}.renaming")
+            steps.append((start, tmp))
+            for node in reversed(chain[1:]):
+                steps.append((node, pending[node]))
+            steps.append((tmp, pending[start]))
+        else:
+            for node in reversed(chain):
+                steps.append((node, pending[node]))
+        for node in chain:
+            del pending[node]
+    return steps
+
+class CopyCancelled(Exception):
+    pass
+
+# 大文件复制：按源盘/目标盘限并发，优先走内核零拷贝，中断后从 .part 的断点续传
+class CopyEngine:
+    def __init__(self, workers=COPY_WORKERS, device_slots=DEVICE_SLOTS, on_progress=None, on_done=None):
+        self.workers = workers
+        self.device_slots = device_slots
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._device_locks = {}
+        self._copied = 0
+        self._done_bytes = 0
+        self._total_bytes = 0
+        self._started = 0.0
+        self._last_report = 0.0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _device_semaphore(self, dev):
+        with self._lock:
+            if dev not in self._device_locks:
+                self._device_locks[dev] = threading.BoundedSemaphore(self.device_slots)
+            return self._device_locks[dev]
+
+    @staticmethod
+    def _device_of(path):
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            return None
+
+    def _advance(self, n, copied=True):
+        with self._lock:
+            self._done_bytes += n
+            if copied:
+                self._copied += n
+            now = time.monotonic()
+            if self.on_progress is None or (now - self._last_report < 0.5 and self._done_bytes < self._total_bytes):
+                return
+            self._last_report = now
+            elapsed = max(now - self._started, 1e-6)
+            rate = self._copied / elapsed
+            eta = (self._total_bytes - self._done_bytes) / rate if rate > 0 else None
+            done, total = self._done_bytes, self._total_bytes
+        self.on_progress(done, total, rate, eta)
+
+    # 拷一段数据，返回实际字节数；copy_file_range -> sendfile -> 普通读写逐级回退
+    @staticmethod
+    def _copy_chunk(methods, fin, fout, offset, count):
+        while True:
+            method = methods[0]
+            try:
+                if method == "copy_file_range":
+                    return os.copy_file_range(fin.fileno(), fout.fileno(), count, offset, offset)
+                if method == "sendfile":
+                    os.lseek(fout.fileno(), offset, os.SEEK_SET)
+                    return os.sendfile(fout.fileno(), fin.fileno(), offset, count)
+                fin.seek(offset)
+                data = fin.read(count)
+                fout.seek(offset)
+                fout.write(data)
+                return len(data)
+            except OSError as e:
+                if method == "readwrite" or e.errno not in FALLBACK_ERRNOS:
+                    raise
+                methods.pop(0)
+
+    @staticmethod
+    def _read_checkpoint(ckpt_path, part_path, st):
+        try:
+            with open(ckpt_path, 'r', encoding='utf-8') as f:
+                ckpt = json.load(f)
+            if ckpt.get("size") != st.st_size or ckpt.get("mtime_ns") != st.st_mtime_ns:
+                return 0
+            offset = int(ckpt.get("offset", 0))
+            return offset if os.path.getsize(part_path) >= offset else 0
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def _write_checkpoint(ckpt_path, src, st, offset):
+        tmp = ckpt_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"src": src, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "offset": offset}, f)
+        os.replace(tmp, ckpt_path)
+
+    @staticmethod
+    def _discard_partial(part_path, ckpt_path):
+        for path in (part_path, ckpt_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
 
-    # 找不到匹配就返回原文件名
-    return filename
+    # 目标已存在且大小、修改时间和源一致，说明上次已经拷完（copystat 会带上修改时间）；FAT 等只精确到 2 秒
+    @staticmethod
+    def _already_copied(st, dst):
+        try:
+            dst_st = os.stat(dst)
+        except OSError:
+            return False
+        return dst_st.st_size == st.st_size and abs(dst_st.st_mtime - st.st_mtime) < 2
+
+    # 返回 True 表示实际复制了，False 表示目标已是完整副本而跳过
+    def copy_one(self, src, dst):
+        part_path = dst + PART_SUFFIX
+        ckpt_path = dst + CHECKPOINT_SUFFIX
+        st = os.stat(src)
+        if self._already_copied(st, dst):
+            self._discard_partial(part_path, ckpt_path)
+            self._advance(st.st_size, copied=False)
+            return False
+        try:
+            self._copy_to_part(src, dst, st, part_path, ckpt_path)
+        except CopyCancelled:
+            raise
+        except BaseException:
+            # 出错放弃的文件不留断点，下次从头拷，也不在目标目录里留下残片
+            self._discard_partial(part_path, ckpt_path)
+            raise
+        return True
+
+    def _copy_to_part(self, src, dst, st, part_path, ckpt_path):
+        offset = self._read_checkpoint(ckpt_path, part_path, st)
+        if offset:
+            self._advance(offset, copied=False)
+        methods = ["readwrite"]
+        if hasattr(os, "sendfile"):
+            methods.insert(0, "sendfile")
+        if hasattr(os, "copy_file_range"):
+            methods.insert(0, "copy_file_range")
+
+        with open(src, 'rb') as fin, open(part_path, 'r+b' if offset else 'wb') as fout:
+            # 断点之后的数据没落过盘，不可信，截掉重拷
+            fout.truncate(offset)
+            since_checkpoint = 0
+            while offset < st.st_size:
+                if self.cancel_event.is_set():
+                    fout.flush()
+                    os.fsync(fout.fileno())
+                    self._write_checkpoint(ckpt_path, src, st, offset)
+                    raise CopyCancelled()
+                n = self._copy_chunk(methods, fin, fout, offset, min(COPY_CHUNK, st.st_size - offset))
+                if n <= 0:
+                    raise IOError(f"源文件提前结束: {src}")
+                offset += n
+                since_checkpoint += n
+                self._advance(n)
+                if since_checkpoint >= CHECKPOINT_BYTES:
+                    fout.flush()
+                    os.fsync(fout.fileno())
+                    self._write_checkpoint(ckpt_path, src, st, offset)
+                    since_checkpoint = 0
+            fout.flush()
+            os.fsync(fout.fileno())
+        shutil.copystat(src, part_path)
+        os.replace(part_path, dst)
+        self._discard_partial(part_path, ckpt_path)
+
+    def _run_job(self, src, dst):
+        if self.cancel_event.is_set():
+            return src, dst, CopyCancelled()
+        # 按设备号排序加锁，源盘和目标盘各占一个名额，不会互相等死
+        devs = sorted({d for d in (self._device_of(src), self._device_of(os.path.dirname(dst))) if d is not None})
+        sems = [self._device_semaphore(d) for d in devs]
+        for sem in sems:
+            sem.acquire()
+        copied = False
+        try:
+            copied = self.copy_one(src, dst)
+            err = None
+        except Exception as e:
+            err = e
+        finally:
+            for sem in reversed(sems):
+                sem.release()
+        if self.on_done:
+            self.on_done(src, dst, err, copied)
+        return src, dst, err
+
+    # jobs: [(源, 目标)]，阻塞直到全部完成或取消；返回 (成功列表, 失败列表, 是否取消)
+    def run(self, jobs):
+        self._total_bytes = 0
+        for src, _ in jobs:
+            try:
+                self._total_bytes += os.path.getsize(src)
+            except OSError:
+                pass
+        self._started = time.monotonic()
+        done, failed = [], []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for src, dst, err in pool.map(lambda job: self._run_job(*job), jobs):
+                if err is None:
+                    done.append((src, dst))
+                elif not isinstance(err, CopyCancelled):
+                    failed.append((src, dst, err))
+        return done, failed, self.cancel_event.is_set()
+
+# 只追加的操作日志：每行一条 JSON，带批次号和批内序号；撤销也只是追加 "undone" 记录
+class OperationJournal:
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+        # 上次崩溃留下半行的话先补个换行，免得下一条记录拼在坏行后面
+        if self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._seq = {}
+
+    def _append(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._unsynced += 1
+            if self._unsynced >= JOURNAL_FSYNC_EVERY or time.monotonic() - self._last_sync > 1:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def begin(self, mode, src_dir, dst_dir=""):
+        batch = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self._seq[batch] = 0
+        self._append({"batch": batch, "op": "begin", "mode": mode, "src_dir": src_dir, "dst_dir": dst_dir,
+                      "ts": time.time()})
+        return batch
+
+    def record(self, batch, op, src, dst):
+        with self._lock:
+            seq = self._seq[batch] = self._seq.get(batch, 0) + 1
+        self._append({"batch": batch, "seq": seq, "op": op, "src": src, "dst": dst})
+
+    def mark_undone(self, batch, seq):
+        self._append({"batch": batch, "seq": seq, "op": "undone"})
+
+    # 旧版 operation_log.json 整体当成一个批次导入
+    def import_legacy(self, legacy_path):
+        if not os.path.exists(legacy_path):
+            return 0
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            ops = json.load(f)
+        if ops:
+            batch = self.begin("legacy", "", "")
+            for op in ops:
+                self.record(batch, op.get("op", "copy"), op["src"], op["dst"])
+            self.flush()
+        os.replace(legacy_path, legacy_path + ".migrated")
+        return len(ops)
+
+    def _read(self):
+        self.flush()
+        batches = {}
+        if not os.path.exists(self.path):
+            return batches
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # 崩溃时最后一行可能只写了一半
+                    continue
+                info = batches.setdefault(rec["batch"], {"meta": {}, "ops": {}, "undone": set()})
+                if rec["op"] == "begin":
+                    info["meta"] = rec
+                elif rec["op"] == "undone":
+                    info["undone"].add(rec["seq"])
+                else:
+                    info["ops"][rec["seq"]] = rec
+        return batches
+
+    # 返回 [(批次号, 元信息, 总条数, 未撤销条数)]，新的在前
+    def batches(self):
+        result = []
+        for batch, info in self._read().items():
+            pending = len(info["ops"]) - len(info["undone"] & info["ops"].keys())
+            result.append((batch, info["meta"], len(info["ops"]), pending))
+        result.sort(key=lambda b: b[1].get("ts", 0), reverse=True)
+        return result
+
+    # 某批次还没撤销的操作，按执行顺序
+    def pending(self, batch):
+        info = self._read().get(batch)
+        if not info:
+            return []
+        return [info["ops"][seq] for seq in sorted(info["ops"]) if seq not in info["undone"]]
 
 class BatchEpisodeApp:
     def __init__(self, root):
@@ -67,8 +512,9 @@ class BatchEpisodeApp:
         self.root.title("剧集集数批量加减（复制改名） - 支持撤销和进度条")
         self.root.geometry("800x550")
 
-        # 操作记录，用于撤销，格式：[{"src":原文件, "dst":复制文件}]
-        self.operation_log = []
+        # 操作日志，用于撤销任意一批，见 OperationJournal
+        self.journal = None
+        self.ui_queue = queue.Queue()  # 工作线程 -> 主线程的界面更新
 
         # UI布局
         tk.Label(root, text="源目录：").grid(row=0, column=0, sticky="e")
@@ -94,17 +540,28 @@ class BatchEpisodeApp:
         self.start_button = tk.Button(root, text="开始复制并改名", command=self.start_task)
         self.start_button.grid(row=4, column=1, pady=10, sticky="w")
 
-        self.undo_button = tk.Button(root, text="撤销上一次操作", command=self.undo_last, state="disabled")
+        self.in_place_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(root, text="原地改名（不复制，忽略目标目录）", variable=self.in_place_var).grid(row=4, column=1, pady=10)
+
+        self.undo_button = tk.Button(root, text="撤销操作…", command=self.choose_undo_batch, state="disabled")
         self.undo_button.grid(row=4, column=1, pady=10, sticky="e")
 
+        self.cancel_button = tk.Button(root, text="取消复制", command=self.cancel_copy, state="disabled")
+        self.cancel_button.grid(row=4, column=2, pady=10)
+        self.copy_engine = None
+
         self.progress = Progressbar(root, orient='horizontal', length=700, mode='determinate')
         self.progress.grid(row=5, column=0, columnspan=3, padx=10)
 
+        self.status_label = tk.Label(root, text="", anchor="w")
+        self.status_label.grid(row=6, column=0, columnspan=3, padx=10, sticky="w")
+
         self.log_text = scrolledtext.ScrolledText(root, width=95, height=22, state='disabled')
-        self.log_text.grid(row=6, column=0, columnspan=3, padx=10, pady=10)
+        self.log_text.grid(row=7, column=0, columnspan=3, padx=10, pady=10)
 
         self.load_config()
         self.load_operation_log()
+        self.root.after(UI_POLL_MS, self._poll_queue)
 
     def log(self, msg):
         self.log_text.config(state='normal')
@@ -112,6 +569,31 @@ class BatchEpisodeApp:
         self.log_text.see(tk.END)
         self.log_text.config(state='disabled')
 
+    # 主线程定时批量处理队列里的界面更新，Tk 控件只在这里碰
+    def _poll_queue(self):
+        try:
+            while True:
+                kind, value = self.ui_queue.get_nowait()
+                if kind == "log":
+                    self.log(value)
+                elif kind == "progress":
+                    done, maximum = value
+                    if maximum is not None:
+                        self.progress['maximum'] = maximum
+                    self.progress['value'] = done
+                elif kind == "status":
+                    self.status_label.config(text=value)
+                elif kind == "cancel":
+                    self.cancel_button.config(state=value)
+                elif kind == "task_done":
+                    self.start_button.config(state="normal")
+                    self.refresh_undo_button()
+                elif kind == "undo_done":
+                    self._undo_finished(value)
+        except queue.Empty:
+            pass
+        self.root.after(UI_POLL_MS, self._poll_queue)
+
     def select_src(self):
         path = filedialog.askdirectory()
         if path:
@@ -130,6 +612,7 @@ class BatchEpisodeApp:
             "dst": self.dst_entry.get(),
             "delta": self.delta_entry.get(),
             "exts": self.ext_entry.get(),
+            "in_place": self.in_place_var.get(),
         }
         try:
             with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
@@ -146,77 +629,116 @@ class BatchEpisodeApp:
                 self.dst_entry.insert(0, data.get("dst", ""))
                 self.delta_entry.insert(0, data.get("delta", ""))
                 self.ext_entry.insert(0, data.get("exts", ".mp4,.mkv,.avi,.mov,.wmv"))
+                self.in_place_var.set(data.get("in_place", False))
             except Exception as e:
                 self.log(f"加载配置失败: {e}")
         else:
             self.ext_entry.insert(0, ".mp4,.mkv,.avi,.mov,.wmv")
 
-    def save_operation_log(self):
+    def load_operation_log(self):
         try:
-            with open(LOG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.operation_log, f, ensure_ascii=False, indent=2)
+            self.journal = OperationJournal(JOURNAL_FILE)
+            migrated = self.journal.import_legacy(LOG_FILE)
+            if migrated:
+                self.log(f"已把旧操作记录中的 {migrated} 条导入操作日志。")
         except Exception as e:
-            self.log(f"保存操作记录失败: {e}")
+            self.log(f"加载操作记录失败: {e}")
+        self.refresh_undo_button()
 
-    def load_operation_log(self):
-        if os.path.exists(LOG_FILE):
-            try:
-                with open(LOG_FILE, 'r', encoding='utf-8') as f:
-                    self.operation_log = json.load(f)
-                if self.operation_log:
-                    self.undo_button.config(state="normal")
-                else:
-                    self.undo_button.config(state="disabled")
-            except Exception as e:
-                self.log(f"加载操作记录失败: {e}")
-                self.undo_button.config(state="disabled")
-        else:
-            self.undo_button.config(state="disabled")
+    def refresh_undo_button(self):
+        undoable = self.journal is not None and any(b[3] for b in self.journal.batches())
+        self.undo_button.config(state="normal" if undoable else "disabled")
 
     def batch_copy_and_rename(self, src_dir, dst_dir, delta, exts):
-        files = find_episodes(src_dir, exts)
-        self.log(f"找到 {len(files)} 个符合扩展名的文件。")
-        self.progress['maximum'] = len(files)
-        self.progress['value'] = 0
+        parsed_files = EPISODE_PARSER.parse_dir(src_dir, exts)
+        self.ui_queue.put(("log", f"找到 {len(parsed_files)} 个符合扩展名的文件。"))
 
-        self.operation_log.clear()
-
-        count = 0
-        for idx, f in enumerate(files, 1):
-            rel_path = os.path.relpath(f, src_dir)
-            new_dir = os.path.join(dst_dir, os.path.dirname(rel_path))
-            os.makedirs(new_dir, exist_ok=True)
-
-            parsed = parse_episode_number(os.path.basename(f))
+        jobs = []
+        for f, parsed in parsed_files:
             if not parsed:
-                self.log(f"跳过未识别集数的文件: {f}")
-                self.progress['value'] = idx
+                self.ui_queue.put(("log", f"跳过未识别集数的文件: {f}"))
                 continue
-            season, episode = parsed
-            new_episode = episode + delta
+            new_episode = parsed.episode + delta
             if new_episode < 1:
-                self.log(f"跳过调整后集数小于1的文件: {f}")
-                self.progress['value'] = idx
+                self.ui_queue.put(("log", f"跳过调整后集数小于1的文件: {f}"))
                 continue
 
-            new_name = replace_episode_number(os.path.basename(f), season, new_episode)
-            src_full_path = f
-            dst_full_path = os.path.join(new_dir, new_name)
-
-            try:
-                shutil.copy2(src_full_path, dst_full_path)
-                self.log(f"复制并重命名: {src_full_path} -> {dst_full_path}")
-                count += 1
-                # 记录操作
-                self.operation_log.append({"src": src_full_path, "dst": dst_full_path})
-            except Exception as e:
-                self.log(f"复制失败: {src_full_path} -> {dst_full_path}，错误：{e}")
-
-            self.progress['value'] = idx
+            rel_path = os.path.relpath(f, src_dir)
+            new_dir = os.path.join(dst_dir, os.path.dirname(rel_path))
+            os.makedirs(new_dir, exist_ok=True)
+            new_name = EPISODE_PARSER.replace(os.path.basename(f), parsed, new_episode)
+            jobs.append((f, os.path.join(new_dir, new_name)))
 
-        self.save_operation_log()
-        self.undo_button.config(state="normal")
-        self.log(f"操作完成！成功复制并重命名 {count} 个文件。")
+        self.ui_queue.put(("progress", (0, max(sum(os.path.getsize(src) for src, _ in jobs), 1))))
+        self.batch_id = self.journal.begin("copy", src_dir, dst_dir)
+        self.copy_engine = CopyEngine(on_progress=self._copy_progress, on_done=self._copy_done)
+        self.ui_queue.put(("cancel", "normal"))
+        try:
+            done, failed, cancelled = self.copy_engine.run(jobs)
+        finally:
+            self.ui_queue.put(("cancel", "disabled"))
+            self.copy_engine = None
+            self.journal.flush()
+
+        if cancelled:
+            self.ui_queue.put(("log", f"已取消！完成 {len(done)} 个，未完成的文件已保留断点，重新开始会接着复制。"))
+        else:
+            self.ui_queue.put(("log", f"操作完成！成功复制并重命名 {len(done)} 个文件，失败 {len(failed)} 个。"))
+
+    def _copy_progress(self, done, total, rate, eta):
+        eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta is not None else "--:--:--"
+        self.ui_queue.put(("progress", (done, None)))
+        self.ui_queue.put(("status",
+                           f"{done / 1024 ** 3:.2f} / {total / 1024 ** 3:.2f} GB  {rate / 1024 ** 2:.1f} MB/s  剩余 {eta_text}"))
+
+    def _copy_done(self, src, dst, err, copied=True):
+        if err is None and not copied:
+            # 上次已经拷完的文件不记进这一批，撤销这一批时不会删掉它
+            self.ui_queue.put(("log", f"目标已是完整副本，跳过: {dst}"))
+        elif err is None:
+            self.ui_queue.put(("log", f"复制并重命名: {src} -> {dst}"))
+            # 记录操作
+            self.journal.record(self.batch_id, "copy", src, dst)
+        elif not isinstance(err, CopyCancelled):
+            self.ui_queue.put(("log", f"复制失败: {src} -> {dst}，错误：{err}"))
+
+    def cancel_copy(self):
+        if self.copy_engine:
+            self.copy_engine.cancel()
+            self.log("正在取消，等待进行中的文件写入断点……")
+
+    def batch_rename_in_place(self, src_dir, delta, exts):
+        parsed_files = EPISODE_PARSER.parse_dir(src_dir, exts)
+        self.ui_queue.put(("log", f"找到 {len(parsed_files)} 个符合扩展名的文件。"))
+        pairs, skipped = plan_renames(parsed_files, delta)
+        for f, reason in skipped:
+            self.ui_queue.put(("log", f"跳过: {f}，{reason}"))
+        steps = order_renames(pairs, f"{os.getpid()}-{threading.get_ident()}")
+        targets = set(pairs.values())
+        self.ui_queue.put(("progress", (0, max(len(steps), 1))))
+
+        batch = self.journal.begin("rename", src_dir)
+        count = 0
+        try:
+            for idx, (src, dst) in enumerate(steps, 1):
+                # 按计划这一步的目标此时应该是空位；规划之后才出现的文件不能被 os.rename 覆盖
+                if os.path.lexists(dst):
+                    self.ui_queue.put(("log", f"改名冲突: {dst} 已存在，未覆盖，已停止后续改名"))
+                    break
+                try:
+                    os.rename(src, dst)
+                except Exception as e:
+                    # 后面的步骤依赖这一步腾出的位置，出错就停下，已完成的部分可以撤销
+                    self.ui_queue.put(("log", f"改名失败: {src} -> {dst}，错误：{e}，已停止后续改名"))
+                    break
+                self.journal.record(batch, "rename", src, dst)
+                if dst in targets:
+                    count += 1
+                    self.ui_queue.put(("log", f"改名: {src} -> {dst}"))
+                self.ui_queue.put(("progress", (idx, None)))
+        finally:
+            self.journal.flush()
+        self.ui_queue.put(("log", f"操作完成！成功原地改名 {count} 个文件。"))
 
     def start_task(self):
         src_dir = self.src_entry.get().strip()
@@ -227,7 +749,8 @@ class BatchEpisodeApp:
         if not os.path.isdir(src_dir):
             messagebox.showerror("错误", "源目录无效或不存在！")
             return
-        if not os.path.isdir(dst_dir):
+        in_place = self.in_place_var.get()
+        if not in_place and not os.path.isdir(dst_dir):
             messagebox.showerror("错误", "目标目录无效或不存在！")
             return
         try:
@@ -254,39 +777,108 @@ class BatchEpisodeApp:
         self.progress['value'] = 0
 
         self.start_button.config(state="disabled")
-        threading.Thread(target=self._thread_task, args=(src_dir, dst_dir, delta, exts), daemon=True).start()
+        threading.Thread(target=self._thread_task, args=(src_dir, dst_dir, delta, exts, in_place), daemon=True).start()
 
-    def _thread_task(self, src_dir, dst_dir, delta, exts):
-        self.batch_copy_and_rename(src_dir, dst_dir, delta, exts)
-        self.start_button.config(state="normal")
+    def _thread_task(self, src_dir, dst_dir, delta, exts, in_place=False):
+        try:
+            if in_place:
+                self.batch_rename_in_place(src_dir, delta, exts)
+            else:
+                self.batch_copy_and_rename(src_dir, dst_dir, delta, exts)
+        except Exception as e:
+            self.ui_queue.put(("log", f"任务出错: {e}"))
+        finally:
+            self.ui_queue.put(("task_done", None))
 
-    def undo_last(self):
-        if not self.operation_log:
+    def choose_undo_batch(self):
+        batches = [b for b in self.journal.batches() if b[3]]
+        if not batches:
             messagebox.showinfo("提示", "没有可撤销的操作。")
             self.undo_button.config(state="disabled")
             return
 
-        failed = 0
-        for op in self.operation_log:
+        win = tk.Toplevel(self.root)
+        win.title("选择要撤销的批次")
+        listbox = tk.Listbox(win, width=100, height=12)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        mode_names = {"copy": "复制改名", "rename": "原地改名", "legacy": "旧记录"}
+        for batch, meta, total, pending in batches:
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(meta.get("ts", 0)))
+            listbox.insert(tk.END, f"{created}  {mode_names.get(meta.get('mode'), meta.get('mode', ''))}  "
+                                   f"{meta.get('src_dir', '')}  未撤销 {pending}/{total}")
+        listbox.selection_set(0)
+
+        def confirm():
+            sel = listbox.curselection()
+            if not sel:
+                return
+            batch = batches[sel[0]][0]
+            win.destroy()
+            self.undo_button.config(state="disabled")
+            self.start_button.config(state="disabled")
+            threading.Thread(target=self._undo_batch, args=(batch,), daemon=True).start()
+
+        tk.Button(win, text="撤销所选批次", command=confirm).pack(pady=(0, 10))
+
+    def _undo_batch(self, batch):
+        ops = self.journal.pending(batch)
+        self.ui_queue.put(("progress", (0, max(len(ops), 1))))
+        lock = threading.Lock()
+        state = {"done": 0, "failed": 0}
+
+        def finish(op, ok, msg):
+            with lock:
+                state["done"] += 1
+                if ok:
+                    self.journal.mark_undone(batch, op["seq"])
+                else:
+                    state["failed"] += 1
+                self.ui_queue.put(("progress", (state["done"], None)))
+            self.ui_queue.put(("log", msg))
+
+        def remove_copy(op):
             dst = op['dst']
             try:
                 if os.path.exists(dst):
                     os.remove(dst)
-                    self.log(f"撤销删除: {dst}")
+                    finish(op, True, f"撤销删除: {dst}")
                 else:
-                    self.log(f"撤销失败，文件不存在: {dst}")
-                    failed += 1
+                    # 文件已经不在了，没有可撤销的内容，记为已撤销以免这批一直挂着
+                    finish(op, True, f"文件已不存在，跳过: {dst}")
             except Exception as e:
-                self.log(f"撤销失败: {dst}，错误：{e}")
-                failed += 1
+                finish(op, False, f"撤销失败: {dst}，错误：{e}")
 
+        # 不管中途出什么错，都要通知主线程恢复按钮
+        try:
+            # 原地改名按执行的逆序改回去，每一步的原名此时都已经空出来；中途失败就停，后面的依赖它
+            for op in reversed([op for op in ops if op["op"] == "rename"]):
+                # 原名处后来又出现了文件，os.rename 会直接覆盖它；当作冲突停下，后面的步骤依赖这一步
+                if os.path.lexists(op['src']):
+                    finish(op, False, f"撤销改名冲突: {op['src']} 已存在，未覆盖，已停止后续撤销改名")
+                    break
+                try:
+                    os.rename(op['dst'], op['src'])
+                    finish(op, True, f"撤销改名: {op['dst']} -> {op['src']}")
+                except Exception as e:
+                    finish(op, False, f"撤销改名失败: {op['dst']} -> {op['src']}，错误：{e}")
+                    break
+
+            with ThreadPoolExecutor(max_workers=UNDO_WORKERS) as pool:
+                list(pool.map(remove_copy, [op for op in ops if op["op"] != "rename"]))
+            self.journal.flush()
+        except Exception as e:
+            state["failed"] += 1
+            self.ui_queue.put(("log", f"撤销出错: {e}"))
+        finally:
+            self.ui_queue.put(("undo_done", state["failed"]))
+
+    def _undo_finished(self, failed):
+        self.start_button.config(state="normal")
+        self.refresh_undo_button()
         if failed == 0:
-            messagebox.showinfo("撤销成功", "已成功撤销上一次操作。")
-            self.operation_log.clear()
-            self.save_operation_log()
-            self.undo_button.config(state="disabled")
+            messagebox.showinfo("撤销成功", "已成功撤销所选批次。")
         else:
-            messagebox.showwarning("部分撤销失败", f"部分文件未能成功删除，请检查日志。")
+            messagebox.showwarning("部分撤销失败", f"{failed} 个文件未能撤销，请检查日志，可以再次撤销该批次重试。")
 
 if __name__ == "__main__":
     root = tk.Tk()